@@ -0,0 +1,115 @@
+import asyncio
+import heapq
+import os
+import logging
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import AsyncIterator, List
+from dotenv import load_dotenv
+from pymongo import ReplaceOne
+import database
+from scheduler import CLINIC_TIMEZONE, DailyJobScheduler
+
+logger = logging.getLogger(__name__)
+
+# Appointments in these statuses are final and move to appointments_archive
+# once their date is ARCHIVE_AFTER_DAYS in the past
+ARCHIVE_STATUSES = ["cancelled", "completed"]
+ARCHIVE_AFTER_DAYS = int(os.environ.get('APPOINTMENT_ARCHIVE_AFTER_DAYS', '1'))
+# Local hour at which the archiver runs
+ARCHIVE_HOUR = int(os.environ.get('APPOINTMENT_ARCHIVE_HOUR', '3'))
+ARCHIVE_BATCH_SIZE = 500
+
+
+def sort_key(appointment: dict) -> tuple:
+    """The (createdAt, id) order used by the list and export routes"""
+    return appointment["createdAt"], appointment["id"]
+
+
+async def archive_appointments(db, today: date, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """
+    Move final, past-dated appointments to appointments_archive in batches:
+    each batch is copied with one bulk upsert, then removed from the hot
+    collection with one delete. A batch interrupted in between is simply
+    copied again on the next run. Slot occupancy for the archived days is
+    dropped as well, since those slots can no longer be booked.
+    Returns the number of appointments archived
+    """
+    cutoff = (today - timedelta(days=ARCHIVE_AFTER_DAYS)).isoformat()
+    query = {"date": {"$lte": cutoff}, "status": {"$in": ARCHIVE_STATUSES}}
+    archived = 0
+    while True:
+        batch = await db.appointments.find(query, {"_id": 0}).limit(batch_size).to_list(batch_size)
+        if not batch:
+            break
+        archived_at = datetime.utcnow()
+        await db.appointments_archive.bulk_write([
+            ReplaceOne({"id": appointment["id"]}, {**appointment, "archivedAt": archived_at}, upsert=True)
+            for appointment in batch
+        ], ordered=False)
+        ids = [appointment["id"] for appointment in batch]
+        result = await db.appointments.delete_many({"id": {"$in": ids}, **query})
+        if result.deleted_count < len(ids):
+            # Some were reopened between the copy and the delete; they stay hot
+            kept = await db.appointments.distinct("id", {"id": {"$in": ids}})
+            await db.appointments_archive.delete_many({"id": {"$in": kept}})
+        archived += result.deleted_count
+    await db.slot_occupancy.delete_many({"date": {"$lte": cutoff}})
+    logger.info(f"Archived {archived} appointments dated {cutoff} or earlier")
+    return archived
+
+
+async def merged_newest_first(*cursors) -> AsyncIterator[dict]:
+    """
+    Merge cursors that are each sorted newest first by (createdAt, id) into
+    one stream in the same order, holding one document per cursor
+    """
+    iterators = [cursor.__aiter__() for cursor in cursors]
+    heads: List[tuple] = []
+
+    async def push(position: int) -> None:
+        try:
+            document = await iterators[position].__anext__()
+        except StopAsyncIteration:
+            return
+        # heapq is a min-heap, so the key inverts the comparison
+        heapq.heappush(heads, (_Descending(sort_key(document)), position, document))
+
+    for position in range(len(iterators)):
+        await push(position)
+    while heads:
+        _, position, document = heapq.heappop(heads)
+        yield document
+        await push(position)
+
+
+class _Descending:
+    """Heap key that sorts in reverse"""
+    __slots__ = ("key",)
+
+    def __init__(self, key):
+        self.key = key
+
+    def __lt__(self, other):
+        return self.key > other.key
+
+
+class ArchiveScheduler(DailyJobScheduler):
+    """Archives final, past-dated appointments once a day at ARCHIVE_HOUR clinic time"""
+
+    def __init__(self, db, hour: int = ARCHIVE_HOUR):
+        super().__init__(db, "appointment_archive", hour, archive_appointments)
+
+
+async def main():
+    database.connect()
+    try:
+        db = database.get_db()
+        await database.ensure_indexes(db)
+        await archive_appointments(db, datetime.now(CLINIC_TIMEZONE).date())
+    finally:
+        database.close()
+
+if __name__ == "__main__":
+    load_dotenv(Path(__file__).parent / '.env')
+    asyncio.run(main())
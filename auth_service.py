@@ -1,30 +1,130 @@
 from passlib.context import CryptContext
 import os
-from typing import Optional
+import asyncio
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Tuple
 import logging
-from motor.motor_asyncio import AsyncIOMotorClient
+import jwt
+from fastapi import Depends, HTTPException
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from pymongo.errors import DuplicateKeyError
+from database import get_db
+from metrics import BCRYPT_DURATION
 
 logger = logging.getLogger(__name__)
 
 # Password hashing context
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-# MongoDB connection for admin credentials
-mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ.get('DB_NAME', 'test_database')]
+# bcrypt is CPU bound; run it on a small dedicated pool so it never blocks
+# the event loop and concurrent logins cannot use more than this many cores
+hash_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('BCRYPT_WORKERS', '2')),
+    thread_name_prefix="bcrypt",
+)
+
+# Admin session tokens
+TOKEN_ALGORITHM = "HS256"
+TOKEN_TTL_MINUTES = int(os.environ.get('ADMIN_TOKEN_TTL_MINUTES', '30'))
+TOKEN_SECRET = os.environ.get('ADMIN_TOKEN_SECRET')
+if not TOKEN_SECRET:
+    logger.warning(
+        "ADMIN_TOKEN_SECRET not configured. Using a random secret; "
+        "admin tokens will not survive a restart or work across workers."
+    )
+    TOKEN_SECRET = secrets.token_urlsafe(32)
+
+bearer_scheme = HTTPBearer(auto_error=False)
+
+# Hash of a random password nobody knows, verified for unknown usernames so
+# they take as long to reject as a wrong password (no username oracle)
+DUMMY_PASSWORD_HASH = "$2b$12$FqT6AB6BfPgeyvf/KHxj.OlFDnjKVxJdiIwaiKziqpqnGvQ/DDbe."
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a plain password against a hashed password"""
-    return pwd_context.verify(plain_password, hashed_password)
+    started = time.perf_counter()
+    try:
+        return pwd_context.verify(plain_password, hashed_password)
+    finally:
+        BCRYPT_DURATION.observe(time.perf_counter() - started, operation="verify")
 
 def get_password_hash(password: str) -> str:
     """Hash a password"""
-    return pwd_context.hash(password)
+    started = time.perf_counter()
+    try:
+        return pwd_context.hash(password)
+    finally:
+        BCRYPT_DURATION.observe(time.perf_counter() - started, operation="hash")
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password on the bcrypt executor instead of the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(hash_executor, verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    """Hash a password on the bcrypt executor instead of the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(hash_executor, get_password_hash, password)
+
+def create_access_token(username: str) -> Tuple[str, int]:
+    """
+    Issue a signed, short-lived admin token
+    Returns (token, lifetime in seconds)
+    """
+    now = datetime.now(timezone.utc)
+    expires_in = TOKEN_TTL_MINUTES * 60
+    payload = {
+        "sub": username,
+        "iat": now,
+        "exp": now + timedelta(seconds=expires_in),
+    }
+    return jwt.encode(payload, TOKEN_SECRET, algorithm=TOKEN_ALGORITHM), expires_in
+
+def decode_access_token(token: str) -> Optional[str]:
+    """
+    Verify an admin token
+    Returns the username, or None if the token is invalid or expired
+    """
+    try:
+        payload = jwt.decode(token, TOKEN_SECRET, algorithms=[TOKEN_ALGORITHM])
+    except jwt.PyJWTError:
+        return None
+    return payload.get("sub")
+
+async def require_admin(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme)
+) -> str:
+    """FastAPI dependency guarding admin routes; returns the admin username"""
+    username = decode_access_token(credentials.credentials) if credentials else None
+    if not username:
+        raise HTTPException(
+            status_code=401,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return username
+
+async def require_admin_stream(
+    token: Optional[str] = None,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme)
+) -> str:
+    """
+    Like require_admin, but also accepts the token as a `token` query
+    parameter, since browser EventSource connections cannot set headers
+    """
+    if credentials:
+        return await require_admin(credentials)
+    username = decode_access_token(token) if token else None
+    if not username:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return username
 
 async def get_admin_from_db(username: str) -> Optional[dict]:
     """Get admin user from database"""
-    return await db.admin_users.find_one({"username": username})
+    return await get_db().admin_users.find_one({"username": username})
 
 async def verify_admin_credentials(username: str, password: str) -> bool:
     """
@@ -34,22 +134,42 @@ async def verify_admin_credentials(username: str, password: str) -> bool:
     # Get admin from database
     admin = await get_admin_from_db(username)
     
-    # If no admin exists, create default admin with password 'admin123'
-    if not admin:
-        logger.warning("No admin user found in database. Creating default admin.")
-        default_hash = get_password_hash('admin123')
-        await db.admin_users.insert_one({
-            "username": "admin",
-            "password_hash": default_hash,
-            "created_at": "2024-01-01T00:00:00Z"
-        })
-        admin = await get_admin_from_db("admin")
-    
+    # Unknown usernames still pay for one hash so timing does not reveal them
     if not admin:
+        await verify_password_async(password, DUMMY_PASSWORD_HASH)
         return False
     
     # Verify password
-    return verify_password(password, admin['password_hash'])
+    return await verify_password_async(password, admin['password_hash'])
+
+async def ensure_default_admin() -> bool:
+    """
+    Create the default admin account if no admin exists yet.
+    Runs once at startup instead of on the login path; the password comes
+    from ADMIN_DEFAULT_PASSWORD (default 'admin123') and should be changed
+    after the first login.
+    Returns True if an account was created
+    """
+    if await get_db().admin_users.count_documents({}, limit=1):
+        return False
+    logger.warning("No admin user found in database. Creating default admin.")
+    default_hash = await get_password_hash_async(os.environ.get('ADMIN_DEFAULT_PASSWORD', 'admin123'))
+    # Upsert on the unique username index so several workers starting
+    # together create a single account; the losers of the race see a
+    # duplicate key
+    try:
+        result = await get_db().admin_users.update_one(
+            {"username": "admin"},
+            {"$setOnInsert": {
+                "username": "admin",
+                "password_hash": default_hash,
+                "created_at": "2024-01-01T00:00:00Z"
+            }},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        return False
+    return result.upserted_id is not None
 
 async def change_admin_password(old_password: str, new_password: str, username: str) -> tuple[bool, str]:
     """
@@ -62,10 +182,10 @@ async def change_admin_password(old_password: str, new_password: str, username:
         return False, "Current password is incorrect"
     
     # Hash new password
-    new_hash = get_password_hash(new_password)
+    new_hash = await get_password_hash_async(new_password)
     
     # Update password in database
-    result = await db.admin_users.update_one(
+    result = await get_db().admin_users.update_one(
         {"username": username},
         {"$set": {"password_hash": new_hash}}
     )
@@ -0,0 +1,188 @@
+import asyncio
+import calendar
+import os
+import logging
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+from dotenv import load_dotenv
+from pymongo import ReplaceOne
+from pymongo.errors import DuplicateKeyError
+import database
+
+logger = logging.getLogger(__name__)
+
+# Opening hours by weekday (Monday is 0): Mon-Sat 9 AM - 9 PM, Sun 10 AM - 6 PM
+CLINIC_HOURS = {
+    0: ("09:00", "21:00"),
+    1: ("09:00", "21:00"),
+    2: ("09:00", "21:00"),
+    3: ("09:00", "21:00"),
+    4: ("09:00", "21:00"),
+    5: ("09:00", "21:00"),
+    6: ("10:00", "18:00"),
+}
+SLOT_MINUTES = int(os.environ.get('SLOT_MINUTES', '30'))
+SLOT_CAPACITY = int(os.environ.get('SLOT_CAPACITY', '2'))
+
+# Appointment statuses that occupy their slot
+SLOT_HOLDING_STATUSES = {"pending", "confirmed", "completed"}
+
+
+def parse_date(date_str: str) -> date:
+    try:
+        return datetime.strptime(date_str, "%Y-%m-%d").date()
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid date '{date_str}', expected YYYY-MM-DD")
+
+
+def normalize_time(time_str: str) -> str:
+    """Accept '14:30', '14:30:00' or '2:30 PM' and return 'HH:MM'"""
+    value = time_str.strip().upper()
+    for time_format in ("%H:%M", "%H:%M:%S", "%I:%M %p", "%I:%M%p", "%I %p"):
+        try:
+            return datetime.strptime(value, time_format).strftime("%H:%M")
+        except ValueError:
+            continue
+    raise ValueError(f"Invalid time '{time_str}'")
+
+
+def slots_for_day(day: date) -> List[str]:
+    """Start times of every bookable slot on a day"""
+    opens, closes = CLINIC_HOURS[day.weekday()]
+    current = datetime.combine(day, datetime.strptime(opens, "%H:%M").time())
+    end = datetime.combine(day, datetime.strptime(closes, "%H:%M").time())
+    slots = []
+    while current + timedelta(minutes=SLOT_MINUTES) <= end:
+        slots.append(current.strftime("%H:%M"))
+        current += timedelta(minutes=SLOT_MINUTES)
+    return slots
+
+
+def normalize_slot(date_str: str, time_str: str) -> str:
+    """
+    Validate that a date/time pair is a bookable slot
+    Returns the normalized 'HH:MM' time, raises ValueError otherwise
+    """
+    day = parse_date(date_str)
+    slot = normalize_time(time_str)
+    if slot not in slots_for_day(day):
+        raise ValueError(f"{slot} on {date_str} is not a bookable slot")
+    return slot
+
+
+def slot_key(date_str: str, time_str: str) -> str:
+    return f"{date_str}T{time_str}"
+
+
+def holds_slot(appointment: dict) -> bool:
+    return bool(appointment.get("time")) and appointment.get("status") in SLOT_HOLDING_STATUSES
+
+
+async def reserve_slot(db, date_str: str, time_str: str) -> bool:
+    """
+    Atomically take one place in a slot
+    Returns False if the slot is already at capacity
+    """
+    key = slot_key(date_str, time_str)
+    try:
+        await db.slot_occupancy.update_one(
+            {"_id": key, "count": {"$lt": SLOT_CAPACITY}},
+            {
+                "$inc": {"count": 1},
+                "$setOnInsert": {"date": date_str, "time": time_str, "month": date_str[:7]},
+            },
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        # Either the slot is full or a concurrent booking created its document
+        # first (upserts are not retried when the filter is more than the _id);
+        # the document exists now, so the plain conditional update decides
+        result = await db.slot_occupancy.update_one(
+            {"_id": key, "count": {"$lt": SLOT_CAPACITY}},
+            {"$inc": {"count": 1}},
+        )
+        return result.modified_count == 1
+    return True
+
+
+async def reserve_slots(db, slots: List[tuple]) -> List[bool]:
+    """Reserve several (date, time) slots concurrently"""
+    return list(await asyncio.gather(*(reserve_slot(db, d, t) for d, t in slots)))
+
+
+async def release_slot(db, date_str: str, time_str: str) -> None:
+    """Give back one place in a slot"""
+    await db.slot_occupancy.update_one(
+        {"_id": slot_key(date_str, time_str), "count": {"$gt": 0}},
+        {"$inc": {"count": -1}},
+    )
+
+
+async def month_availability(db, month: str) -> Dict[str, List[dict]]:
+    """
+    Open places for every slot of a month (YYYY-MM), from one indexed read
+    of the occupancy collection
+    """
+    try:
+        first_day = datetime.strptime(month, "%Y-%m").date()
+    except ValueError:
+        raise ValueError(f"Invalid month '{month}', expected YYYY-MM")
+    booked = {
+        occupancy["_id"]: occupancy["count"]
+        async for occupancy in db.slot_occupancy.find({"month": month}, {"count": 1})
+    }
+    days_in_month = calendar.monthrange(first_day.year, first_day.month)[1]
+    availability = {}
+    for offset in range(days_in_month):
+        day = first_day + timedelta(days=offset)
+        date_str = day.isoformat()
+        availability[date_str] = [
+            {"time": slot, "available": max(SLOT_CAPACITY - booked.get(slot_key(date_str, slot), 0), 0)}
+            for slot in slots_for_day(day)
+        ]
+    return availability
+
+
+async def rebuild_slot_occupancy(db, month: Optional[str] = None) -> int:
+    """
+    Recompute occupancy from the appointments themselves, e.g. after a
+    migration or for appointments booked before slots were tracked
+    Returns the number of occupied slots written
+    """
+    query = {"status": {"$in": list(SLOT_HOLDING_STATUSES)}, "time": {"$ne": None}}
+    if month:
+        query["date"] = {"$regex": f"^{month}-"}
+    counts: Dict[tuple, int] = {}
+    async for appointment in db.appointments.find(query, {"_id": 0, "date": 1, "time": 1}):
+        try:
+            slot = normalize_time(appointment["time"])
+            parse_date(appointment["date"])
+        except ValueError:
+            continue
+        counts[(appointment["date"], slot)] = counts.get((appointment["date"], slot), 0) + 1
+
+    await db.slot_occupancy.delete_many({"month": month} if month else {})
+    if counts:
+        await db.slot_occupancy.bulk_write([
+            ReplaceOne(
+                {"_id": slot_key(date_str, time_str)},
+                {"date": date_str, "time": time_str, "month": date_str[:7], "count": count},
+                upsert=True,
+            )
+            for (date_str, time_str), count in counts.items()
+        ], ordered=False)
+    logger.info(f"Rebuilt occupancy for {len(counts)} slots")
+    return len(counts)
+
+
+async def main():
+    database.connect()
+    try:
+        await rebuild_slot_occupancy(database.get_db())
+    finally:
+        database.close()
+
+if __name__ == "__main__":
+    load_dotenv(Path(__file__).parent / '.env')
+    asyncio.run(main())
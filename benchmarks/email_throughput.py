@@ -0,0 +1,98 @@
+"""
+Measure email rendering and SMTP delivery throughput against a local
+aiosmtpd sink, comparing one connection per message with one shared
+SMTPSession for the whole batch.
+
+    python benchmarks/email_throughput.py --messages 200
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import AuthResult
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from email_service import SMTPSession, build_appointment_reminder_message  # noqa: E402
+
+
+class SinkHandler:
+    """Accept and discard every message"""
+
+    def __init__(self):
+        self.received = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received += 1
+        return "250 Message accepted for delivery"
+
+
+def accept_any_login(server, session, envelope, mechanism, auth_data):
+    return AuthResult(success=True)
+
+
+def sample_appointment(i: int) -> dict:
+    return {
+        "id": str(i),
+        "name": f"Patient {i}",
+        "service": "Dental Cleaning",
+        "date": "2024-06-01",
+        "time": "10:30",
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--port", type=int, default=8025)
+    args = parser.parse_args()
+
+    handler = SinkHandler()
+    controller = Controller(
+        handler,
+        hostname="127.0.0.1",
+        port=args.port,
+        authenticator=accept_any_login,
+        auth_require_tls=False,
+    )
+    controller.start()
+    settings = {
+        "server": "127.0.0.1",
+        "port": args.port,
+        "email": "clinic@example.com",
+        "password": "secret",
+        "starttls": False,
+    }
+    try:
+        started = time.perf_counter()
+        messages = [
+            build_appointment_reminder_message(sample_appointment(i), f"patient{i}@example.com", settings["email"])
+            for i in range(args.messages)
+        ]
+        render_seconds = time.perf_counter() - started
+        print(f"render:             {args.messages / render_seconds:10.0f} msg/s")
+
+        started = time.perf_counter()
+        for message in messages:
+            with SMTPSession(settings) as session:
+                session.send(message)
+        per_message_seconds = time.perf_counter() - started
+        print(f"connection per msg: {args.messages / per_message_seconds:10.0f} msg/s")
+
+        started = time.perf_counter()
+        with SMTPSession(settings) as session:
+            for message in messages:
+                session.send(message)
+        shared_seconds = time.perf_counter() - started
+        print(f"shared session:     {args.messages / shared_seconds:10.0f} msg/s")
+        print(f"speedup:            {per_message_seconds / shared_seconds:10.1f}x")
+    finally:
+        controller.stop()
+
+    assert handler.received == 2 * args.messages, f"sink received {handler.received} messages"
+
+
+if __name__ == "__main__":
+    main()
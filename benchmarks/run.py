@@ -0,0 +1,282 @@
+"""
+Offline load test for the API.
+
+Boots server.app in-process (through its lifespan) against mongomock-motor,
+or a local mongod with --mongo-url, and a local aiosmtpd sink, then drives a
+weighted mix of appointment creates, list reads, status changes, gallery
+reads and admin logins from concurrent clients. Reports p50/p95/p99 latency
+and requests per second per route.
+
+    python benchmarks/run.py --requests 2000 --concurrency 20
+    python benchmarks/run.py --save-baseline            # record baselines/default.json
+    python benchmarks/run.py --compare                  # exit 1 on a p95 regression
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+import httpx
+import numpy as np
+from aiosmtpd.controller import Controller
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+BASELINE_DIR = Path(__file__).resolve().parent / "baselines"
+sys.path.insert(0, str(ROOT_DIR))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from email_throughput import SinkHandler, accept_any_login  # noqa: E402
+
+ADMIN_USERNAME = "admin"
+ADMIN_PASSWORD = "benchmark-password"
+SERVICES = ["Dental Cleaning", "Root Canal", "Teeth Whitening", "Braces Consultation", "Tooth Extraction"]
+
+# Relative weight of each route in the request mix
+ROUTE_MIX = {
+    "POST /api/appointments": 30,
+    "GET /api/appointments": 20,
+    "PATCH /api/appointments/{id}/status": 15,
+    "GET /api/gallery": 30,
+    "POST /api/admin/login": 5,
+}
+
+
+def configure_environment(args) -> None:
+    """Point the app at the local stand-ins before it is imported"""
+    os.environ["MONGO_URL"] = args.mongo_url or "mongodb://localhost:27017"
+    os.environ["DB_NAME"] = args.db_name
+    os.environ["ADMIN_TOKEN_SECRET"] = "benchmark-secret-" + "x" * 32
+    os.environ["SMTP_SERVER"] = "127.0.0.1"
+    os.environ["SMTP_PORT"] = str(args.smtp_port)
+    os.environ["SMTP_EMAIL"] = "clinic@example.com"
+    os.environ["SMTP_PASSWORD"] = "secret"
+    os.environ["SMTP_STARTTLS"] = "false"
+    # Measure route cost rather than slot exhaustion
+    os.environ.setdefault("SLOT_CAPACITY", "1000000")
+
+
+async def seed(db, appointments: int) -> None:
+    from auth_service import get_password_hash
+    from seed_data import initial_images
+
+    # The lifespan already bootstrapped the default admin; give it a known password
+    await db.admin_users.update_one(
+        {"username": ADMIN_USERNAME},
+        {"$set": {"password_hash": get_password_hash(ADMIN_PASSWORD)}},
+        upsert=True,
+    )
+    await db.gallery_images.insert_many([dict(image) for image in initial_images])
+    if appointments:
+        from server import Appointment
+        await db.appointments.insert_many([
+            Appointment(**random_appointment()).dict() for _ in range(appointments)
+        ])
+
+
+def random_appointment() -> dict:
+    from availability import slots_for_day
+
+    day = date.today() + timedelta(days=random.randint(1, 90))
+    return {
+        "name": f"Patient {random.randint(1, 10 ** 6)}",
+        "phone": f"9{random.randint(10 ** 8, 10 ** 9 - 1)}",
+        "email": f"patient{random.randint(1, 10 ** 6)}@example.com",
+        "date": day.isoformat(),
+        "time": random.choice(slots_for_day(day)),
+        "service": random.choice(SERVICES),
+    }
+
+
+class LoadTest:
+    def __init__(self, client: httpx.AsyncClient, token: str):
+        self.client = client
+        self.headers = {"Authorization": f"Bearer {token}"}
+        self.latencies = {route: [] for route in ROUTE_MIX}
+        self.errors = {route: 0 for route in ROUTE_MIX}
+        self.pending_ids = []
+        self.gallery_etag = None
+
+    async def call(self, route: str) -> None:
+        started = time.perf_counter()
+        if route == "POST /api/appointments":
+            response = await self.client.post("/api/appointments", json=random_appointment())
+            if response.status_code == 200:
+                self.pending_ids.append(response.json()["id"])
+        elif route == "GET /api/appointments":
+            response = await self.client.get("/api/appointments", params={"limit": 50}, headers=self.headers)
+        elif route == "PATCH /api/appointments/{id}/status":
+            if not self.pending_ids:
+                return
+            appointment_id = self.pending_ids.pop(random.randrange(len(self.pending_ids)))
+            status = random.choice(["confirmed", "cancelled"])
+            response = await self.client.patch(
+                f"/api/appointments/{appointment_id}/status", json={"status": status}, headers=self.headers
+            )
+        elif route == "GET /api/gallery":
+            # Half the readers revalidate a cached copy, like returning browsers
+            headers = {"If-None-Match": self.gallery_etag} if self.gallery_etag and random.random() < 0.5 else {}
+            response = await self.client.get("/api/gallery", headers=headers)
+            self.gallery_etag = response.headers.get("etag", self.gallery_etag)
+        else:
+            response = await self.client.post(
+                "/api/admin/login", json={"username": ADMIN_USERNAME, "password": ADMIN_PASSWORD}
+            )
+        self.latencies[route].append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            self.errors[route] += 1
+
+    async def run(self, total_requests: int, concurrency: int) -> float:
+        routes = list(ROUTE_MIX)
+        plan = random.choices(routes, weights=[ROUTE_MIX[r] for r in routes], k=total_requests)
+        queue = asyncio.Queue()
+        for route in plan:
+            queue.put_nowait(route)
+
+        async def worker():
+            while not queue.empty():
+                await self.call(queue.get_nowait())
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return time.perf_counter() - started
+
+    def report(self, elapsed: float) -> dict:
+        report = {}
+        for route, samples in self.latencies.items():
+            if not samples:
+                continue
+            p50, p95, p99 = np.percentile(np.array(samples) * 1000, [50, 95, 99])
+            report[route] = {
+                "requests": len(samples),
+                "errors": self.errors[route],
+                "p50_ms": round(float(p50), 3),
+                "p95_ms": round(float(p95), 3),
+                "p99_ms": round(float(p99), 3),
+                "rps": round(len(samples) / elapsed, 1),
+            }
+        return report
+
+
+def print_report(report: dict, elapsed: float) -> None:
+    print(f"{'route':40} {'reqs':>6} {'errs':>5} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'req/s':>8}")
+    for route, row in report.items():
+        print(
+            f"{route:40} {row['requests']:6d} {row['errors']:5d} {row['p50_ms']:8.2f} "
+            f"{row['p95_ms']:8.2f} {row['p99_ms']:8.2f} {row['rps']:8.1f}"
+        )
+    total = sum(row["requests"] for row in report.values())
+    print(f"{'total':40} {total:6d} {'':5} {'':8} {'':8} {'':8} {total / elapsed:8.1f}")
+
+
+def machine_info() -> dict:
+    """What a run's numbers depend on besides the code; saved with baselines"""
+    return {
+        "host": platform.node(),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "bcryptWorkers": int(os.environ.get("BCRYPT_WORKERS", "2")),
+    }
+
+
+def compare_with_baseline(report: dict, baseline: dict, tolerance: float) -> list:
+    """Routes whose p95 latency regressed by more than `tolerance` (a fraction)"""
+    regressions = []
+    for route, row in report.items():
+        reference = baseline.get("routes", {}).get(route)
+        if reference and row["p95_ms"] > reference["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{route}: p95 {row['p95_ms']:.2f} ms vs baseline {reference['p95_ms']:.2f} ms")
+    return regressions
+
+
+async def main(args) -> int:
+    configure_environment(args)
+    random.seed(args.seed)
+
+    import database
+    import server
+
+    if not args.mongo_url:
+        from mongomock_motor import AsyncMongoMockClient
+        database.connect(client=AsyncMongoMockClient())
+
+    controller = Controller(
+        SinkHandler(),
+        hostname="127.0.0.1",
+        port=args.smtp_port,
+        authenticator=accept_any_login,
+        auth_require_tls=False,
+    )
+    controller.start()
+    try:
+        async with server.lifespan(server.app):
+            db = database.get_db()
+            if args.mongo_url:
+                await database.get_db().client.drop_database(args.db_name)
+                await database.ensure_indexes(db)
+            await seed(db, args.seed_appointments)
+
+            transport = httpx.ASGITransport(app=server.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+                login = await client.post(
+                    "/api/admin/login", json={"username": ADMIN_USERNAME, "password": ADMIN_PASSWORD}
+                )
+                load_test = LoadTest(client, login.json()["access_token"])
+                elapsed = await load_test.run(args.requests, args.concurrency)
+            report = load_test.report(elapsed)
+    finally:
+        controller.stop()
+
+    print_report(report, elapsed)
+    result = {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "backend": "mongod" if args.mongo_url else "mongomock",
+        "seedAppointments": args.seed_appointments,
+        "machine": machine_info(),
+        "routes": report,
+    }
+    baseline_path = BASELINE_DIR / f"{args.baseline}.json"
+    if args.save_baseline:
+        BASELINE_DIR.mkdir(exist_ok=True)
+        baseline_path.write_text(json.dumps(result, indent=2) + "\n")
+        print(f"Saved baseline to {baseline_path}")
+    if args.compare:
+        if not baseline_path.exists():
+            print(f"No baseline at {baseline_path}; record one on this machine with --save-baseline")
+            return 1
+        baseline = json.loads(baseline_path.read_text())
+        for key in ("requests", "concurrency", "backend", "seedAppointments", "machine"):
+            if baseline.get(key) != result[key]:
+                print(f"WARNING baseline {key} differs: {baseline.get(key)} vs {result[key]}")
+        regressions = compare_with_baseline(report, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--seed-appointments", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--mongo-url", help="Use a local mongod instead of mongomock-motor")
+    parser.add_argument("--db-name", default="happy_benchmark")
+    parser.add_argument("--smtp-port", type=int, default=8026)
+    parser.add_argument("--baseline", default="default", help="Baseline name under benchmarks/baselines")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed p95 regression (fraction)")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
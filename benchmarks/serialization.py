@@ -0,0 +1,97 @@
+"""
+Measure CPU time per listed item for the appointment and gallery list
+responses, comparing model validation + jsonable_encoder + json.dumps with
+the projected rows encoded by orjson that the list routes use.
+
+    python benchmarks/serialization.py --items 1000 --rounds 20
+"""
+import argparse
+import json
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from server import (  # noqa: E402
+    APPOINTMENT_DEFAULTS,
+    GALLERY_IMAGE_DEFAULTS,
+    Appointment,
+    GalleryImage,
+)
+
+
+def sample_rows(items: int):
+    created = datetime(2024, 1, 1)
+    appointments = [
+        {
+            "id": str(uuid.uuid4()),
+            "name": f"Patient {i}",
+            "phone": f"98{i:08d}",
+            "email": f"patient{i}@example.com",
+            "date": "2024-02-01",
+            "time": "10:30",
+            "service": "Dental Cleaning",
+            "message": None,
+            "status": "confirmed",
+            "createdAt": created + timedelta(seconds=i, milliseconds=i % 1000),
+        }
+        for i in range(items)
+    ]
+    images = [
+        {
+            "id": str(uuid.uuid4()),
+            "url": f"https://example.com/images/{i}.jpg",
+            "title": f"Image {i}",
+            "category": "clinic",
+            "createdAt": created + timedelta(seconds=i),
+        }
+        for i in range(items)
+    ]
+    return appointments, images
+
+
+def model_path(model, rows) -> bytes:
+    # What the routes did before: build a model per row, then encode it
+    return json.dumps(
+        jsonable_encoder([model(**row) for row in rows]), ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def fast_path(defaults, rows) -> bytes:
+    return orjson.dumps([{**defaults, **row} for row in rows])
+
+
+def per_item_us(function, rows, rounds: int) -> float:
+    started = time.process_time()
+    for _ in range(rounds):
+        function(rows)
+    return (time.process_time() - started) / (rounds * len(rows)) * 1e6
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    appointments, images = sample_rows(args.items)
+    cases = [
+        ("appointments", Appointment, APPOINTMENT_DEFAULTS, appointments),
+        ("gallery", GalleryImage, GALLERY_IMAGE_DEFAULTS, images),
+    ]
+    print(f"{'list':14} {'model us/item':>14} {'orjson us/item':>15} {'speedup':>8}")
+    for name, model, defaults, rows in cases:
+        assert json.loads(model_path(model, rows)) == json.loads(fast_path(defaults, rows))
+        slow = per_item_us(lambda r: model_path(model, r), rows, args.rounds)
+        fast = per_item_us(lambda r: fast_path(defaults, r), rows, args.rounds)
+        print(f"{name:14} {slow:14.2f} {fast:15.2f} {slow / fast:7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
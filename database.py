@@ -0,0 +1,183 @@
+import os
+import logging
+from typing import Optional
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from metrics import MongoCommandMetrics
+
+logger = logging.getLogger(__name__)
+
+# The one client shared by every module in the process
+_client: Optional[AsyncIOMotorClient] = None
+_db: Optional[AsyncIOMotorDatabase] = None
+
+
+def client_options() -> dict:
+    """
+    Connection pool, timeout, read preference and write concern settings
+    Every value can be overridden through the environment
+    """
+    options = {
+        "maxPoolSize": int(os.environ.get('MONGO_MAX_POOL_SIZE', '50')),
+        "minPoolSize": int(os.environ.get('MONGO_MIN_POOL_SIZE', '0')),
+        "maxIdleTimeMS": int(os.environ.get('MONGO_MAX_IDLE_TIME_MS', '60000')),
+        "waitQueueTimeoutMS": int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', '5000')),
+        "connectTimeoutMS": int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', '5000')),
+        "serverSelectionTimeoutMS": int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000')),
+        "readPreference": os.environ.get('MONGO_READ_PREFERENCE', 'primary'),
+    }
+    socket_timeout = os.environ.get('MONGO_SOCKET_TIMEOUT_MS')
+    if socket_timeout:
+        options["socketTimeoutMS"] = int(socket_timeout)
+    write_concern = os.environ.get('MONGO_WRITE_CONCERN')
+    if write_concern:
+        options["w"] = int(write_concern) if write_concern.isdigit() else write_concern
+    if os.environ.get('MONGO_WRITE_CONCERN_JOURNAL'):
+        options["journal"] = os.environ['MONGO_WRITE_CONCERN_JOURNAL'].lower() == "true"
+    return options
+
+
+def connect(client: Optional[AsyncIOMotorClient] = None) -> AsyncIOMotorDatabase:
+    """
+    Create the shared client (or adopt the one given) and return the database
+    Calling it again while connected returns the existing database
+    """
+    global _client, _db
+    if _db is not None:
+        return _db
+    if client is None:
+        client = AsyncIOMotorClient(
+            os.environ['MONGO_URL'],
+            event_listeners=[MongoCommandMetrics()],
+            **client_options(),
+        )
+    _client = client
+    _db = client[os.environ['DB_NAME']]
+    return _db
+
+
+def get_db() -> AsyncIOMotorDatabase:
+    """Return the shared database; connect() must have been called"""
+    if _db is None:
+        raise RuntimeError("Database not connected. Call database.connect() first.")
+    return _db
+
+
+def close() -> None:
+    global _client, _db
+    if _client is not None:
+        _client.close()
+    _client = None
+    _db = None
+
+
+async def ping() -> bool:
+    """Check that the pool can reach the server"""
+    if _client is None:
+        return False
+    try:
+        await _client.admin.command("ping")
+        return True
+    except Exception as e:
+        logger.warning(f"MongoDB ping failed: {str(e)}")
+        return False
+
+
+async def ensure_archive_ttl_index(db: AsyncIOMotorDatabase) -> None:
+    """
+    Expire archived appointments APPOINTMENT_ARCHIVE_TTL_DAYS after they were
+    archived; without the setting they are kept for good
+    """
+    ttl_days = os.environ.get('APPOINTMENT_ARCHIVE_TTL_DAYS')
+    indexes = await db.appointments_archive.index_information()
+    if not ttl_days:
+        if "archivedAt_ttl" in indexes:
+            await db.appointments_archive.drop_index("archivedAt_ttl")
+        return
+    expire_after = int(ttl_days) * 86400
+    if "archivedAt_ttl" in indexes:
+        # Changing the period of an existing TTL index needs collMod
+        await db.command("collMod", "appointments_archive", index={
+            "name": "archivedAt_ttl", "expireAfterSeconds": expire_after,
+        })
+        return
+    await db.appointments_archive.create_index(
+        [("archivedAt", 1)], name="archivedAt_ttl", expireAfterSeconds=expire_after
+    )
+
+
+async def ensure_outbox_ttl_indexes(db: AsyncIOMotorDatabase) -> None:
+    """
+    Expire sent and dead-lettered emails EMAIL_OUTBOX_RETENTION_DAYS (default
+    30) after they were sent or given up on; only those messages have the
+    sentAt / deadAt fields
+    """
+    expire_after = int(os.environ.get('EMAIL_OUTBOX_RETENTION_DAYS', '30')) * 86400
+    indexes = await db.email_outbox.index_information()
+    for field in ("sentAt", "deadAt"):
+        name = f"{field}_ttl"
+        if name in indexes:
+            if indexes[name].get("expireAfterSeconds") != expire_after:
+                await db.command("collMod", "email_outbox", index={
+                    "name": name, "expireAfterSeconds": expire_after,
+                })
+            continue
+        await db.email_outbox.create_index([(field, 1)], name=name, expireAfterSeconds=expire_after)
+
+
+async def ensure_indexes(db: AsyncIOMotorDatabase) -> None:
+    """Create the indexes the API relies on; safe to run on every startup"""
+    await db.appointments.create_index("id", unique=True)
+    await db.appointments.create_index([("createdAt", -1), ("id", -1)])
+    await db.appointments.create_index([("status", 1), ("createdAt", -1), ("id", -1)])
+    await db.appointments.create_index([("service", 1), ("createdAt", -1), ("id", -1)])
+    await db.appointments.create_index([("date", 1), ("status", 1)])
+    # The archive serves the same list filters as the hot collection
+    await db.appointments_archive.create_index("id", unique=True)
+    await db.appointments_archive.create_index([("createdAt", -1), ("id", -1)])
+    await db.appointments_archive.create_index([("status", 1), ("createdAt", -1), ("id", -1)])
+    await db.appointments_archive.create_index([("service", 1), ("createdAt", -1), ("id", -1)])
+    await ensure_archive_ttl_index(db)
+    # Patient search keys, matched by prefix
+    for collection in (db.appointments, db.appointments_archive):
+        await collection.create_index("phoneDigits")
+        await collection.create_index("emailLower")
+        await collection.create_index("nameWords")
+        await collection.create_index([("patientId", 1), ("createdAt", -1), ("id", -1)])
+    await db.patients.create_index("id", unique=True)
+    await db.gallery_images.create_index([("createdAt", -1)])
+    await db.gallery_images.create_index([("category", 1), ("createdAt", -1)])
+    await db.gallery_images.create_index([("file", 1)], sparse=True)
+    await db.email_outbox.create_index("id", unique=True)
+    await db.email_outbox.create_index([("status", 1), ("nextAttemptAt", 1)])
+    await db.email_outbox.create_index([("status", 1), ("lockedUntil", 1)])
+    await ensure_outbox_ttl_indexes(db)
+    await db.slot_occupancy.create_index([("month", 1)])
+    # Unique, so workers bootstrapping the default admin together cannot
+    # create it twice; an older non-unique index is replaced
+    admin_indexes = await db.admin_users.index_information()
+    if "username_1" in admin_indexes and not admin_indexes["username_1"].get("unique"):
+        await remove_duplicate_admins(db)
+        await db.admin_users.drop_index("username_1")
+    elif "username_1" not in admin_indexes:
+        await remove_duplicate_admins(db)
+    await db.admin_users.create_index("username", unique=True)
+
+
+async def remove_duplicate_admins(db: AsyncIOMotorDatabase) -> int:
+    """
+    Older versions inserted a new admin row for unknown usernames on login,
+    so a username may have several rows. Keep the one logins read today
+    (find_one on the username), so its password keeps working, and delete
+    the rest. Returns the number of rows deleted
+    """
+    duplicates = db.admin_users.aggregate([
+        {"$group": {"_id": "$username", "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ])
+    deleted = 0
+    async for duplicate in duplicates:
+        kept = await db.admin_users.find_one({"username": duplicate["_id"]})
+        result = await db.admin_users.delete_many({"username": duplicate["_id"], "_id": {"$ne": kept["_id"]}})
+        deleted += result.deleted_count
+        logger.warning(f"Removed {result.deleted_count} duplicate admin rows for '{duplicate['_id']}'")
+    return deleted
@@ -0,0 +1,201 @@
+import asyncio
+import os
+import smtplib
+import uuid
+import logging
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from pymongo import ReturnDocument
+
+from email_service import (
+    SMTPSession,
+    build_appointment_confirmation_message,
+    build_appointment_reminder_message,
+    get_smtp_settings,
+)
+
+logger = logging.getLogger(__name__)
+
+# Outbox message states
+OUTBOX_PENDING = "pending"
+OUTBOX_SENDING = "sending"
+OUTBOX_SENT = "sent"
+OUTBOX_DEAD = "dead"
+
+# Message builders by outbox kind: (data, recipient, sender) -> MIME message
+MESSAGE_BUILDERS = {
+    "appointment_confirmation": build_appointment_confirmation_message,
+    "appointment_reminder": build_appointment_reminder_message,
+}
+
+# Set whenever a message is enqueued so an idle worker wakes up immediately
+_wakeup = asyncio.Event()
+
+
+def new_outbox_message(kind: str, recipient_email: str, data: dict) -> dict:
+    """Build an outbox document ready to be inserted"""
+    if kind not in MESSAGE_BUILDERS:
+        raise ValueError(f"Unknown email kind: {kind}")
+    now = datetime.utcnow()
+    return {
+        "id": str(uuid.uuid4()),
+        "kind": kind,
+        "recipient": recipient_email,
+        "data": data,
+        "status": OUTBOX_PENDING,
+        "attempts": 0,
+        "nextAttemptAt": now,
+        "lockedUntil": None,
+        "lastError": None,
+        "createdAt": now,
+    }
+
+
+async def enqueue_email(db, kind: str, recipient_email: str, data: dict) -> str:
+    """
+    Queue an email for delivery by the outbox worker
+    Returns the outbox message id
+    """
+    message = new_outbox_message(kind, recipient_email, data)
+    await db.email_outbox.insert_one(message)
+    _wakeup.set()
+    return message["id"]
+
+
+async def enqueue_emails(db, messages: List[Tuple[str, str, dict]]) -> List[str]:
+    """
+    Queue several (kind, recipient, data) emails with a single insert
+    Returns the outbox message ids
+    """
+    if not messages:
+        return []
+    documents = [new_outbox_message(kind, recipient, data) for kind, recipient, data in messages]
+    await db.email_outbox.insert_many(documents)
+    _wakeup.set()
+    return [document["id"] for document in documents]
+
+
+class EmailOutboxWorker:
+    """
+    Background task that drains the email outbox.
+    Claimed messages are sent one after another over a single SMTP session,
+    which stays open for as long as there is work and is closed once the
+    outbox is empty. Failed messages are retried with exponential backoff
+    and dead-lettered after max_attempts.
+    """
+
+    def __init__(
+        self,
+        db,
+        poll_interval: float = float(os.environ.get('EMAIL_OUTBOX_POLL_SECONDS', '5')),
+        max_attempts: int = int(os.environ.get('EMAIL_OUTBOX_MAX_ATTEMPTS', '5')),
+        backoff_base: float = float(os.environ.get('EMAIL_OUTBOX_BACKOFF_SECONDS', '30')),
+        lease_seconds: float = 300,
+    ):
+        self.db = db
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.lease_seconds = lease_seconds
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> bool:
+        """Start the worker; returns False if SMTP is not configured"""
+        settings = get_smtp_settings()
+        if not settings:
+            logger.warning("SMTP credentials not configured. Email outbox worker not started.")
+            return False
+        self._task = asyncio.create_task(self._run(settings))
+        return True
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self, settings: dict) -> None:
+        session = SMTPSession(settings)
+        try:
+            while True:
+                _wakeup.clear()
+                try:
+                    await self._drain(session)
+                except Exception as e:
+                    logger.error(f"Email outbox worker error: {str(e)}")
+                finally:
+                    await asyncio.to_thread(session.close)
+                try:
+                    await asyncio.wait_for(_wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            await asyncio.to_thread(session.close)
+
+    async def _claim(self) -> Optional[dict]:
+        """Atomically claim the next due message, including expired leases"""
+        now = datetime.utcnow()
+        return await self.db.email_outbox.find_one_and_update(
+            {"$or": [
+                {"status": OUTBOX_PENDING, "nextAttemptAt": {"$lte": now}},
+                {"status": OUTBOX_SENDING, "lockedUntil": {"$lte": now}},
+            ]},
+            {"$set": {
+                "status": OUTBOX_SENDING,
+                "lockedUntil": now + timedelta(seconds=self.lease_seconds),
+            }},
+            sort=[("nextAttemptAt", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def _drain(self, session: SMTPSession) -> None:
+        while True:
+            outbox_message = await self._claim()
+            if outbox_message is None:
+                return
+            await self._deliver(session, outbox_message)
+
+    async def _deliver(self, session: SMTPSession, outbox_message: dict) -> None:
+        build_message = MESSAGE_BUILDERS[outbox_message["kind"]]
+        try:
+            message = build_message(
+                outbox_message["data"],
+                outbox_message["recipient"],
+                session.settings["email"],
+            )
+            await asyncio.to_thread(session.send, message)
+        except Exception as e:
+            await self._fail(outbox_message, e)
+            return
+
+        await self.db.email_outbox.update_one(
+            {"id": outbox_message["id"]},
+            {"$set": {"status": OUTBOX_SENT, "sentAt": datetime.utcnow(), "lockedUntil": None}},
+        )
+        logger.info(f"{outbox_message['kind']} email sent to {outbox_message['recipient']}")
+
+    async def _fail(self, outbox_message: dict, error: Exception) -> None:
+        attempts = outbox_message["attempts"] + 1
+        # Refused recipients will not start working on a retry
+        permanent = isinstance(error, smtplib.SMTPRecipientsRefused)
+        if permanent or attempts >= self.max_attempts:
+            update = {"status": OUTBOX_DEAD, "deadAt": datetime.utcnow()}
+            logger.error(
+                f"Email {outbox_message['id']} dead-lettered after {attempts} attempt(s): {str(error)}"
+            )
+        else:
+            delay = self.backoff_base * (2 ** (attempts - 1))
+            update = {
+                "status": OUTBOX_PENDING,
+                "nextAttemptAt": datetime.utcnow() + timedelta(seconds=delay),
+            }
+            logger.warning(
+                f"Email {outbox_message['id']} failed (attempt {attempts}), retrying in {delay:.0f}s: {str(error)}"
+            )
+        update.update({"attempts": attempts, "lastError": str(error), "lockedUntil": None})
+        await self.db.email_outbox.update_one({"id": outbox_message["id"]}, {"$set": update})
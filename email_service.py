@@ -1,12 +1,243 @@
 import smtplib
+import html
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from string import Template
 import os
+import time
 from typing import Optional
 import logging
+from metrics import SMTP_DURATION
 
 logger = logging.getLogger(__name__)
 
+def get_smtp_settings() -> Optional[dict]:
+    """
+    Read SMTP settings from the environment
+    Returns None if credentials are not configured
+    """
+    smtp_email = os.environ.get('SMTP_EMAIL')
+    smtp_password = os.environ.get('SMTP_PASSWORD')
+    if not smtp_email or not smtp_password:
+        return None
+    return {
+        "server": os.environ.get('SMTP_SERVER', 'smtp.gmail.com'),
+        "port": int(os.environ.get('SMTP_PORT', '587')),
+        "email": smtp_email,
+        "password": smtp_password,
+        "starttls": os.environ.get('SMTP_STARTTLS', 'true').lower() != 'false',
+    }
+
+
+class SMTPSession:
+    """
+    A reusable, authenticated SMTP connection.
+    The connection is opened on the first send and kept open for the
+    following ones, so a burst of messages pays for one TLS handshake and
+    login. Any SMTP error drops the connection; the next send reconnects.
+    """
+
+    def __init__(self, settings: dict):
+        self.settings = settings
+        self._server: Optional[smtplib.SMTP] = None
+
+    def _connect(self) -> smtplib.SMTP:
+        started = time.perf_counter()
+        server = smtplib.SMTP(self.settings["server"], self.settings["port"], timeout=30)
+        try:
+            if self.settings.get("starttls", True):
+                server.starttls()
+            server.login(self.settings["email"], self.settings["password"])
+        except Exception:
+            server.close()
+            SMTP_DURATION.observe(time.perf_counter() - started, operation="connect", outcome="failure")
+            raise
+        SMTP_DURATION.observe(time.perf_counter() - started, operation="connect", outcome="success")
+        return server
+
+    def send(self, message: MIMEMultipart) -> None:
+        if self._server is None:
+            self._server = self._connect()
+        started = time.perf_counter()
+        try:
+            self._server.send_message(message)
+        except Exception:
+            SMTP_DURATION.observe(time.perf_counter() - started, operation="send", outcome="failure")
+            self.close()
+            raise
+        SMTP_DURATION.observe(time.perf_counter() - started, operation="send", outcome="success")
+
+    def close(self) -> None:
+        if self._server is None:
+            return
+        try:
+            self._server.quit()
+        except Exception:
+            self._server.close()
+        self._server = None
+
+    def __enter__(self) -> "SMTPSession":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+# Email templates, compiled once at import and reused for every message.
+# The HTML layout wraps a per-email banner and note; values are substituted
+# with string.Template and HTML-escaped for the HTML part.
+HTML_LAYOUT = """
+<html>
+    <body style="font-family: Arial, sans-serif; color: #333; line-height: 1.6;">
+        <div style="max-width: 600px; margin: 0 auto; padding: 20px; border: 1px solid #e0e0e0; border-radius: 10px;">
+            <div style="text-align: center; margin-bottom: 30px;">
+                <h1 style="color: #2563eb; margin-bottom: 10px;">Happy Teeth Dental Clinic</h1>
+                <p style="color: #14b8a6; font-size: 16px;">Your smile is our priority!</p>
+            </div>
+            
+            <div style="background-color: #dbeafe; padding: 20px; border-radius: 8px; margin-bottom: 20px;">
+                <h2 style="color: #1e40af; margin-top: 0;">{heading}</h2>
+                <p style="font-size: 16px;">Dear $name,</p>
+                <p>{intro}</p>
+            </div>
+            
+            <div style="background-color: #f9fafb; padding: 20px; border-radius: 8px; margin-bottom: 20px;">
+                <h3 style="color: #374151; margin-top: 0;">Appointment Details:</h3>
+                <table style="width: 100%; border-collapse: collapse;">
+                    <tr>
+                        <td style="padding: 8px 0; font-weight: bold; color: #6b7280;">Service:</td>
+                        <td style="padding: 8px 0;">$service</td>
+                    </tr>
+                    <tr>
+                        <td style="padding: 8px 0; font-weight: bold; color: #6b7280;">Date:</td>
+                        <td style="padding: 8px 0;">$date</td>
+                    </tr>
+                    <tr>
+                        <td style="padding: 8px 0; font-weight: bold; color: #6b7280;">Time:</td>
+                        <td style="padding: 8px 0;">$time</td>
+                    </tr>
+                </table>
+            </div>
+            
+            <div style="background-color: #ecfdf5; padding: 20px; border-radius: 8px; margin-bottom: 20px;">
+                <h3 style="color: #059669; margin-top: 0;">Clinic Information:</h3>
+                <p style="margin: 5px 0;"><strong>Address:</strong><br>
+                First Floor, Block-B, Ubber Realty, SCO No. 33,<br>
+                above Barista, Khanpur, Kharar, Punjab 140301</p>
+                <p style="margin: 5px 0;"><strong>Phone:</strong> 092051 70496</p>
+                <p style="margin: 5px 0;"><strong>Hours:</strong> Mon-Sat: 9 AM - 9 PM | Sun: 10 AM - 6 PM</p>
+            </div>
+            
+            <div style="background-color: #fef3c7; padding: 15px; border-radius: 8px; margin-bottom: 20px;">
+                <p style="margin: 0; font-size: 14px; color: #92400e;">
+                    <strong>Important:</strong> Please arrive 10 minutes before your scheduled time. 
+                    If you need to reschedule or cancel, please call us at least 24 hours in advance.
+                </p>
+            </div>
+            
+            <div style="text-align: center; margin-top: 30px; padding-top: 20px; border-top: 1px solid #e0e0e0;">
+                <p style="color: #6b7280; font-size: 14px;">
+                    Thank you for choosing Happy Teeth Dental Clinic!<br>
+                    We're committed to providing you with the best dental care.
+                </p>
+                <p style="color: #9ca3af; font-size: 12px; margin-top: 15px;">
+                    {footer}
+                </p>
+            </div>
+        </div>
+    </body>
+</html>
+"""
+
+TEXT_LAYOUT = """
+Happy Teeth Dental Clinic
+Your smile is our priority!
+
+{heading}
+
+Dear $name,
+
+{intro}
+
+APPOINTMENT DETAILS:
+Service: $service
+Date: $date
+Time: $time
+
+CLINIC INFORMATION:
+Address: First Floor, Block-B, Ubber Realty, SCO No. 33,
+         above Barista, Khanpur, Kharar, Punjab 140301
+Phone: 092051 70496
+Hours: Mon-Sat: 9 AM - 9 PM | Sun: 10 AM - 6 PM
+
+IMPORTANT: Please arrive 10 minutes before your scheduled time.
+If you need to reschedule or cancel, please call us at least 24 hours in advance.
+
+Thank you for choosing Happy Teeth Dental Clinic!
+"""
+
+
+class EmailTemplate:
+    """A subject plus pre-compiled HTML and plain-text bodies"""
+
+    def __init__(self, subject: str, heading: str, intro: str, footer: str):
+        self.subject = subject
+        self.html = Template(HTML_LAYOUT.format(heading=heading, intro=intro, footer=footer))
+        self.text = Template(TEXT_LAYOUT.format(heading=heading.lstrip("✓ ").upper(), intro=intro, footer=footer))
+
+    def render(self, appointment_data: dict, recipient_email: str, sender_email: str) -> MIMEMultipart:
+        values = {
+            "name": appointment_data.get('name') or 'Patient',
+            "service": appointment_data.get('service') or 'N/A',
+            "date": appointment_data.get('date') or 'N/A',
+            "time": appointment_data.get('time') or 'To be confirmed',
+        }
+        message = MIMEMultipart("alternative")
+        message["Subject"] = self.subject
+        message["From"] = sender_email
+        message["To"] = recipient_email
+        # Attach both versions, plain text first as the fallback
+        message.attach(MIMEText(self.text.substitute(values), "plain"))
+        message.attach(MIMEText(
+            self.html.substitute({key: html.escape(str(value)) for key, value in values.items()}),
+            "html",
+        ))
+        return message
+
+
+CONFIRMATION_TEMPLATE = EmailTemplate(
+    subject="Appointment Confirmed - Happy Teeth Dental Clinic",
+    heading="✓ Appointment Confirmed",
+    intro="Your appointment has been confirmed. We look forward to seeing you!",
+    footer="This is an automated confirmation email. Please do not reply to this email.",
+)
+
+REMINDER_TEMPLATE = EmailTemplate(
+    subject="Appointment Reminder - Happy Teeth Dental Clinic",
+    heading="Appointment Reminder",
+    intro="This is a friendly reminder that your appointment is tomorrow. We look forward to seeing you!",
+    footer="This is an automated reminder email. Please do not reply to this email.",
+)
+
+
+def build_appointment_confirmation_message(
+    appointment_data: dict,
+    recipient_email: str,
+    sender_email: str
+) -> MIMEMultipart:
+    """Build the MIME message for an appointment confirmation email"""
+    return CONFIRMATION_TEMPLATE.render(appointment_data, recipient_email, sender_email)
+
+
+def build_appointment_reminder_message(
+    appointment_data: dict,
+    recipient_email: str,
+    sender_email: str
+) -> MIMEMultipart:
+    """Build the MIME message for a next-day appointment reminder email"""
+    return REMINDER_TEMPLATE.render(appointment_data, recipient_email, sender_email)
+
+
 def send_appointment_confirmation_email(
     appointment_data: dict,
     recipient_email: str
@@ -17,126 +248,21 @@ def send_appointment_confirmation_email(
     """
     logger.info("Sending appointment confirmation email...")
     # Check if SMTP credentials are configured
-    smtp_server = os.environ.get('SMTP_SERVER', 'smtp.gmail.com')
-    smtp_port = int(os.environ.get('SMTP_PORT', '587'))
-    smtp_email = os.environ.get('SMTP_EMAIL')
-    smtp_password = os.environ.get('SMTP_PASSWORD')
+    settings = get_smtp_settings()
     
     # If credentials not configured, log and return False (won't crash the app)
-    if not smtp_email or not smtp_password:
+    if not settings:
         logger.warning("SMTP credentials not configured. Email notification skipped.")
         return False
     logger.info("SMTP credentials configured. Sending email...")
     try:
-        # Create message
-        message = MIMEMultipart("alternative")
-        message["Subject"] = "Appointment Confirmed - Happy Teeth Dental Clinic"
-        message["From"] = smtp_email
-        message["To"] = recipient_email
-        
-        # Email body with appointment details
-        html_content = f"""
-        <html>
-            <body style="font-family: Arial, sans-serif; color: #333; line-height: 1.6;">
-                <div style="max-width: 600px; margin: 0 auto; padding: 20px; border: 1px solid #e0e0e0; border-radius: 10px;">
-                    <div style="text-align: center; margin-bottom: 30px;">
-                        <h1 style="color: #2563eb; margin-bottom: 10px;">Happy Teeth Dental Clinic</h1>
-                        <p style="color: #14b8a6; font-size: 16px;">Your smile is our priority!</p>
-                    </div>
-                    
-                    <div style="background-color: #dbeafe; padding: 20px; border-radius: 8px; margin-bottom: 20px;">
-                        <h2 style="color: #1e40af; margin-top: 0;">✓ Appointment Confirmed</h2>
-                        <p style="font-size: 16px;">Dear {appointment_data.get('name', 'Patient')},</p>
-                        <p>Your appointment has been confirmed. We look forward to seeing you!</p>
-                    </div>
-                    
-                    <div style="background-color: #f9fafb; padding: 20px; border-radius: 8px; margin-bottom: 20px;">
-                        <h3 style="color: #374151; margin-top: 0;">Appointment Details:</h3>
-                        <table style="width: 100%; border-collapse: collapse;">
-                            <tr>
-                                <td style="padding: 8px 0; font-weight: bold; color: #6b7280;">Service:</td>
-                                <td style="padding: 8px 0;">{appointment_data.get('service', 'N/A')}</td>
-                            </tr>
-                            <tr>
-                                <td style="padding: 8px 0; font-weight: bold; color: #6b7280;">Date:</td>
-                                <td style="padding: 8px 0;">{appointment_data.get('date', 'N/A')}</td>
-                            </tr>
-                            <tr>
-                                <td style="padding: 8px 0; font-weight: bold; color: #6b7280;">Time:</td>
-                                <td style="padding: 8px 0;">{appointment_data.get('time', 'To be confirmed')}</td>
-                            </tr>
-                        </table>
-                    </div>
-                    
-                    <div style="background-color: #ecfdf5; padding: 20px; border-radius: 8px; margin-bottom: 20px;">
-                        <h3 style="color: #059669; margin-top: 0;">Clinic Information:</h3>
-                        <p style="margin: 5px 0;"><strong>Address:</strong><br>
-                        First Floor, Block-B, Ubber Realty, SCO No. 33,<br>
-                        above Barista, Khanpur, Kharar, Punjab 140301</p>
-                        <p style="margin: 5px 0;"><strong>Phone:</strong> 092051 70496</p>
-                        <p style="margin: 5px 0;"><strong>Hours:</strong> Mon-Sat: 9 AM - 9 PM | Sun: 10 AM - 6 PM</p>
-                    </div>
-                    
-                    <div style="background-color: #fef3c7; padding: 15px; border-radius: 8px; margin-bottom: 20px;">
-                        <p style="margin: 0; font-size: 14px; color: #92400e;">
-                            <strong>Important:</strong> Please arrive 10 minutes before your scheduled time. 
-                            If you need to reschedule or cancel, please call us at least 24 hours in advance.
-                        </p>
-                    </div>
-                    
-                    <div style="text-align: center; margin-top: 30px; padding-top: 20px; border-top: 1px solid #e0e0e0;">
-                        <p style="color: #6b7280; font-size: 14px;">
-                            Thank you for choosing Happy Teeth Dental Clinic!<br>
-                            We're committed to providing you with the best dental care.
-                        </p>
-                        <p style="color: #9ca3af; font-size: 12px; margin-top: 15px;">
-                            This is an automated confirmation email. Please do not reply to this email.
-                        </p>
-                    </div>
-                </div>
-            </body>
-        </html>
-        """
-        
-        # Plain text version as fallback
-        text_content = f"""
-        Happy Teeth Dental Clinic
-        Your smile is our priority!
-        
-        APPOINTMENT CONFIRMED
-        
-        Dear {appointment_data.get('name', 'Patient')},
-        
-        Your appointment has been confirmed. We look forward to seeing you!
-        
-        APPOINTMENT DETAILS:
-        Service: {appointment_data.get('service', 'N/A')}
-        Date: {appointment_data.get('date', 'N/A')}
-        Time: {appointment_data.get('time', 'To be confirmed')}
-        
-        CLINIC INFORMATION:
-        Address: First Floor, Block-B, Ubber Realty, SCO No. 33,
-                 above Barista, Khanpur, Kharar, Punjab 140301
-        Phone: 092051 70496
-        Hours: Mon-Sat: 9 AM - 9 PM | Sun: 10 AM - 6 PM
-        
-        IMPORTANT: Please arrive 10 minutes before your scheduled time.
-        If you need to reschedule or cancel, please call us at least 24 hours in advance.
-        
-        Thank you for choosing Happy Teeth Dental Clinic!
-        """
-        
-        # Attach both versions
-        part1 = MIMEText(text_content, "plain")
-        part2 = MIMEText(html_content, "html")
-        message.attach(part1)
-        message.attach(part2)
+        message = build_appointment_confirmation_message(
+            appointment_data, recipient_email, settings["email"]
+        )
         
         # Send email
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
-            server.starttls()
-            server.login(smtp_email, smtp_password)
-            server.send_message(message)
+        with SMTPSession(settings) as session:
+            session.send(message)
         
         logger.info(f"Confirmation email sent successfully to {recipient_email}")
         return True
@@ -0,0 +1,166 @@
+import asyncio
+import json
+import os
+import uuid
+import logging
+from collections import deque
+from typing import Deque, List, Optional, Set, Tuple
+from fastapi.encoders import jsonable_encoder
+
+logger = logging.getLogger(__name__)
+
+# With several API workers, set this so every worker relays the Mongo change
+# stream instead of only the changes its own routes made
+USE_CHANGE_STREAM = os.environ.get('APPOINTMENT_EVENTS_CHANGE_STREAM', 'false').lower() == 'true'
+HEARTBEAT_SECONDS = 15
+
+
+class Subscriber:
+    def __init__(self, max_pending: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self.overflowed = False
+
+
+class AppointmentEventBroker:
+    """
+    In-process pub/sub for appointment changes.
+    Each event is serialized once into an SSE frame and fanned out to every
+    subscriber. Recent frames are kept so a reconnecting client can resume
+    from its Last-Event-ID. Event ids are '<epoch>-<sequence>', where the
+    epoch is unique to this process; an id from another process or one
+    older than the history cannot be resumed and yields a 'reset' event.
+    """
+
+    def __init__(self, history_size: int = 1000, max_pending: int = 1000):
+        self.epoch = uuid.uuid4().hex[:8]
+        self.max_pending = max_pending
+        self._sequence = 0
+        self._history: Deque[Tuple[int, str]] = deque(maxlen=history_size)
+        self._subscribers: Set[Subscriber] = set()
+
+    def publish(self, event_type: str, data: dict) -> None:
+        self._sequence += 1
+        frame = format_sse(
+            f"{self.epoch}-{self._sequence}",
+            event_type,
+            json.dumps(jsonable_encoder(data), separators=(",", ":")),
+        )
+        self._history.append((self._sequence, frame))
+        for subscriber in list(self._subscribers):
+            try:
+                subscriber.queue.put_nowait(frame)
+            except asyncio.QueueFull:
+                # A client this far behind reconnects and resumes from history
+                subscriber.overflowed = True
+                self._subscribers.discard(subscriber)
+
+    def subscribe(self, last_event_id: Optional[str] = None) -> Tuple[Subscriber, List[str]]:
+        """Register a subscriber and return the frames it missed since last_event_id"""
+        subscriber = Subscriber(self.max_pending)
+        self._subscribers.add(subscriber)
+        if not last_event_id:
+            return subscriber, []
+        epoch, _, sequence = last_event_id.partition("-")
+        oldest = self._history[0][0] if self._history else self._sequence + 1
+        if epoch != self.epoch or not sequence.isdigit() or int(sequence) < oldest - 1:
+            return subscriber, [format_sse(f"{self.epoch}-{self._sequence}", "reset", "{}")]
+        return subscriber, [frame for seq, frame in self._history if seq > int(sequence)]
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        self._subscribers.discard(subscriber)
+
+
+def format_sse(event_id: str, event_type: str, data: str) -> str:
+    return f"id: {event_id}\nevent: {event_type}\ndata: {data}\n\n"
+
+
+appointment_events = AppointmentEventBroker()
+
+
+def publish_appointment_event(event_type: str, data: dict) -> None:
+    """
+    Publish a change made by this process; skipped when the change stream
+    relay is the source of events, so nothing is delivered twice
+    """
+    if not USE_CHANGE_STREAM:
+        appointment_events.publish(event_type, data)
+
+
+async def event_stream(last_event_id: Optional[str] = None):
+    """Async generator of SSE frames for one client"""
+    subscriber, backlog = appointment_events.subscribe(last_event_id)
+    try:
+        yield "retry: 3000\n\n"
+        for frame in backlog:
+            yield frame
+        while not subscriber.overflowed:
+            try:
+                yield await asyncio.wait_for(subscriber.queue.get(), timeout=HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+    finally:
+        appointment_events.unsubscribe(subscriber)
+
+
+class ChangeStreamRelay:
+    """
+    Background task publishing appointment changes from a MongoDB change
+    stream, so every worker sees changes made by the others. Requires a
+    replica set; delete events carry the appointment id only when
+    pre-images are enabled on the collection (MongoDB 6+).
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._task: Optional[asyncio.Task] = None
+        self._resume_token = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                async with self.db.appointments.watch(
+                    full_document="updateLookup",
+                    full_document_before_change="whenAvailable",
+                    resume_after=self._resume_token,
+                ) as stream:
+                    async for change in stream:
+                        self._resume_token = stream.resume_token
+                        self._relay(change)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Appointment change stream failed, restarting: {str(e)}")
+                await asyncio.sleep(5)
+
+    def _relay(self, change: dict) -> None:
+        operation = change["operationType"]
+        document = change.get("fullDocument") or {}
+        document.pop("_id", None)
+        if operation == "insert":
+            appointment_events.publish("created", document)
+        elif operation == "update":
+            updated_fields = change.get("updateDescription", {}).get("updatedFields", {})
+            if "status" in updated_fields and document:
+                before = change.get("fullDocumentBeforeChange") or {}
+                appointment_events.publish("status_changed", {
+                    "id": document.get("id"),
+                    "status": updated_fields["status"],
+                    "previousStatus": before.get("status"),
+                })
+        elif operation == "delete":
+            before = change.get("fullDocumentBeforeChange") or {}
+            if before.get("id"):
+                appointment_events.publish("deleted", {"id": before["id"]})
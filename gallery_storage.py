@@ -0,0 +1,184 @@
+import asyncio
+import hashlib
+import os
+import re
+import uuid
+import logging
+from pathlib import Path
+from typing import AsyncIterator, NamedTuple, Optional, Tuple
+
+import anyio
+from fastapi import HTTPException, Request, UploadFile
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from response_cache import etag_matches
+
+logger = logging.getLogger(__name__)
+
+STORAGE_DIR = Path(os.environ.get('GALLERY_STORAGE_DIR', Path(__file__).parent / 'uploads' / 'gallery'))
+MAX_UPLOAD_BYTES = int(os.environ.get('GALLERY_MAX_UPLOAD_BYTES', str(10 * 1024 * 1024)))
+CHUNK_SIZE = 64 * 1024
+
+# Stored files are named by their content hash, so a URL never changes meaning
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+FILE_NAME_PATTERN = re.compile(r"^[0-9a-f]{64}\.(jpg|png|gif|webp)$")
+
+MEDIA_TYPES = {
+    "jpg": "image/jpeg",
+    "png": "image/png",
+    "gif": "image/gif",
+    "webp": "image/webp",
+}
+
+
+# Held while a stored file gains or loses a reference, so garbage collection
+# cannot remove a file that an upload in this process is about to reference
+files_lock = asyncio.Lock()
+
+
+class ReceivedFile(NamedTuple):
+    tmp_path: Path
+    name: str
+    size: int
+
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    """Extension for the image format in the first bytes of a file, from its signature"""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head.startswith((b"GIF87a", b"GIF89a")):
+        return "gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+def file_path(name: str) -> Path:
+    # Spread files over 256 directories to keep each one small
+    return STORAGE_DIR / name[:2] / name
+
+
+def file_url(name: str) -> str:
+    return f"/api/gallery/files/{name}"
+
+
+async def receive_upload(upload: UploadFile) -> ReceivedFile:
+    """
+    Copy an uploaded image to a temporary file in storage chunk by chunk,
+    hashing it on the way. Raises HTTPException for non-images and
+    oversized uploads.
+    """
+    STORAGE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_path = STORAGE_DIR / f".upload-{uuid.uuid4().hex}"
+    digest = hashlib.sha256()
+    size = 0
+    extension = None
+    try:
+        async with await anyio.open_file(tmp_path, "wb") as f:
+            while chunk := await upload.read(CHUNK_SIZE):
+                if extension is None:
+                    extension = sniff_image_type(chunk)
+                    if extension is None:
+                        raise HTTPException(status_code=415, detail="Only JPEG, PNG, GIF and WebP images are accepted")
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    raise HTTPException(status_code=413, detail=f"Images may be at most {MAX_UPLOAD_BYTES} bytes")
+                digest.update(chunk)
+                await f.write(chunk)
+        if extension is None:
+            raise HTTPException(status_code=400, detail="The uploaded file is empty")
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    return ReceivedFile(tmp_path=tmp_path, name=f"{digest.hexdigest()}.{extension}", size=size)
+
+
+def store_received(received: ReceivedFile) -> bool:
+    """
+    Move a received file to its content-addressed path; call with files_lock
+    held. Content that is already stored is not written again.
+    Returns True if a new file was stored
+    """
+    path = file_path(received.name)
+    if path.exists():
+        received.tmp_path.unlink(missing_ok=True)
+        return False
+    path.parent.mkdir(exist_ok=True)
+    os.replace(received.tmp_path, path)
+    return True
+
+
+def remove_file(name: str) -> None:
+    try:
+        file_path(name).unlink()
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.error(f"Could not remove gallery file {name}: {str(e)}")
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single-range 'bytes=' header into inclusive (start, end).
+    Returns None when the header should be ignored (multiple ranges or bad
+    syntax) and raises HTTPException 416 when the range is unsatisfiable.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+        else:
+            # Suffix range: the last N bytes
+            start = max(size - int(last), 0)
+            end = size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise HTTPException(status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+    return start, min(end, size - 1)
+
+
+async def read_range(path: Path, start: int, end: int) -> AsyncIterator[bytes]:
+    async with await anyio.open_file(path, "rb") as f:
+        await f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def serve_file(name: str, request: Request) -> Response:
+    """
+    Respond with a stored file, streamed from disk.
+    The content hash in the name doubles as a strong ETag; single byte
+    ranges get a 206.
+    """
+    path = file_path(name) if FILE_NAME_PATTERN.match(name) else None
+    if path is None or not path.is_file():
+        raise HTTPException(status_code=404, detail="File not found")
+
+    etag = f'"{name.split(".")[0]}"'
+    headers = {"ETag": etag, "Cache-Control": IMMUTABLE_CACHE_CONTROL, "Accept-Ranges": "bytes"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    media_type = MEDIA_TYPES[name.rsplit(".", 1)[1]]
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range.strip() == etag):
+        size = path.stat().st_size
+        byte_range = parse_range(range_header, size)
+        if byte_range:
+            start, end = byte_range
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            headers["Content-Length"] = str(end - start + 1)
+            return StreamingResponse(read_range(path, start, end), status_code=206, media_type=media_type, headers=headers)
+    return FileResponse(path, media_type=media_type, headers=headers)
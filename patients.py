@@ -0,0 +1,192 @@
+import asyncio
+import uuid
+import logging
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+from dotenv import load_dotenv
+from pymongo import ReplaceOne, UpdateOne
+import database
+from search import normalize_phone
+
+logger = logging.getLogger(__name__)
+
+# Patient ids are derived from the normalized phone number, so every
+# booking from the same phone maps to the same patient without a lookup
+PATIENT_ID_NAMESPACE = uuid.UUID("0c6f3f4e-8a51-4d0e-b3c5-7f2d9a1e6b42")
+
+
+def patient_id_for(phone: Optional[str]) -> Optional[str]:
+    digits = normalize_phone(phone)
+    return str(uuid.uuid5(PATIENT_ID_NAMESPACE, digits)) if digits else None
+
+
+def _contact(appointment: dict) -> dict:
+    contact = {"name": appointment["name"], "phone": appointment["phone"]}
+    if appointment.get("email"):
+        contact["email"] = appointment["email"]
+    return contact
+
+
+async def record_bookings(db, appointments: Iterable[dict]) -> None:
+    """
+    Upsert the patients of newly created appointments with one bulk write.
+    Contact details follow the latest booking; appointmentCount and
+    lastAppointmentDate summarize the bookings.
+    """
+    by_patient: Dict[str, list] = defaultdict(list)
+    for appointment in appointments:
+        if appointment.get("patientId"):
+            by_patient[appointment["patientId"]].append(appointment)
+    if not by_patient:
+        return
+    now = datetime.utcnow()
+    await db.patients.bulk_write([
+        UpdateOne(
+            {"id": patient_id},
+            {
+                "$setOnInsert": {
+                    "id": patient_id,
+                    "phoneDigits": normalize_phone(bookings[-1]["phone"]),
+                    "visitCount": 0,
+                    "createdAt": now,
+                },
+                "$set": {**_contact(bookings[-1]), "updatedAt": now},
+                "$inc": {"appointmentCount": len(bookings)},
+                "$max": {"lastAppointmentDate": max(booking["date"] for booking in bookings)},
+            },
+            upsert=True,
+        )
+        for patient_id, bookings in by_patient.items()
+    ], ordered=False)
+
+
+async def record_visits(db, appointments: Iterable[dict]) -> None:
+    """Count appointments that were just completed as visits"""
+    operations = [
+        UpdateOne(
+            {"id": appointment["patientId"]},
+            {"$inc": {"visitCount": 1}, "$max": {"lastVisit": appointment["date"]}},
+        )
+        for appointment in appointments if appointment.get("patientId")
+    ]
+    if operations:
+        await db.patients.bulk_write(operations, ordered=False)
+
+
+async def record_deleted_appointment(db, appointment: dict) -> None:
+    if not appointment.get("patientId"):
+        return
+    increments = {"appointmentCount": -1}
+    if appointment.get("status") == "completed":
+        increments["visitCount"] = -1
+    await db.patients.update_one({"id": appointment["patientId"]}, {"$inc": increments})
+
+
+async def rebuild_patients(db) -> int:
+    """
+    Recompute every patient from the appointments, archived ones included,
+    e.g. after a bulk import. Appointments whose patientId is missing or
+    was derived from an older phone normalization are re-keyed, and the
+    patients left without appointments by that are removed.
+    Returns the number of patients written
+    """
+    stale_ids = set()
+    for collection in (db.appointments, db.appointments_archive):
+        appointments = collection.find({}, {"_id": 0, "id": 1, "phone": 1, "patientId": 1}).batch_size(1000)
+        batch = []
+        async for appointment in appointments:
+            patient_id = patient_id_for(appointment.get("phone"))
+            if "patientId" in appointment and appointment["patientId"] == patient_id:
+                continue
+            if appointment.get("patientId"):
+                stale_ids.add(appointment["patientId"])
+            batch.append(UpdateOne({"id": appointment["id"]}, {"$set": {"patientId": patient_id}}))
+            if len(batch) == 1000:
+                await collection.bulk_write(batch, ordered=False)
+                batch = []
+        if batch:
+            await collection.bulk_write(batch, ordered=False)
+
+    patients: Dict[str, dict] = {}
+    for collection in (db.appointments, db.appointments_archive):
+        groups = collection.aggregate([
+            {"$match": {"patientId": {"$ne": None}}},
+            {"$sort": {"createdAt": 1}},
+            {"$group": {
+                "_id": "$patientId",
+                "name": {"$last": "$name"},
+                "phone": {"$last": "$phone"},
+                "createdAt": {"$first": "$createdAt"},
+                "lastCreatedAt": {"$last": "$createdAt"},
+                "appointmentCount": {"$sum": 1},
+                "lastAppointmentDate": {"$max": "$date"},
+                "visitCount": {"$sum": {"$cond": [{"$eq": ["$status", "completed"]}, 1, 0]}},
+                "lastVisit": {"$max": {"$cond": [{"$eq": ["$status", "completed"]}, "$date", None]}},
+            }},
+        ])
+        async for group in groups:
+            patient = patients.get(group["_id"])
+            if patient is None:
+                patients[group["_id"]] = group
+                continue
+            # The same patient in both collections: add up, keep the latest contact details
+            if group["lastCreatedAt"] > patient["lastCreatedAt"]:
+                for field in ("name", "phone", "lastCreatedAt"):
+                    patient[field] = group[field]
+            patient["createdAt"] = min(patient["createdAt"], group["createdAt"])
+            patient["appointmentCount"] += group["appointmentCount"]
+            patient["visitCount"] += group["visitCount"]
+            patient["lastAppointmentDate"] = max(patient["lastAppointmentDate"], group["lastAppointmentDate"])
+            patient["lastVisit"] = max(filter(None, (patient["lastVisit"], group["lastVisit"])), default=None)
+
+    # Like record_bookings, keep the latest email given, even if later bookings had none
+    for collection in (db.appointments, db.appointments_archive):
+        emails = collection.aggregate([
+            {"$match": {"patientId": {"$ne": None}, "email": {"$nin": [None, ""]}}},
+            {"$sort": {"createdAt": 1}},
+            {"$group": {"_id": "$patientId", "email": {"$last": "$email"}, "emailAt": {"$last": "$createdAt"}}},
+        ])
+        async for group in emails:
+            patient = patients.get(group["_id"])
+            if patient and group["emailAt"] >= patient.get("emailAt", group["emailAt"]):
+                patient["email"], patient["emailAt"] = group["email"], group["emailAt"]
+
+    now = datetime.utcnow()
+    operations = []
+    for patient_id, group in patients.items():
+        document = {
+            "id": patient_id,
+            "phoneDigits": normalize_phone(group["phone"]),
+            **_contact(group),
+            "appointmentCount": group["appointmentCount"],
+            "lastAppointmentDate": group["lastAppointmentDate"],
+            "visitCount": group["visitCount"],
+            "createdAt": group["createdAt"],
+            "updatedAt": now,
+        }
+        if group["lastVisit"]:
+            document["lastVisit"] = group["lastVisit"]
+        operations.append(ReplaceOne({"id": patient_id}, document, upsert=True))
+    for start in range(0, len(operations), 1000):
+        await db.patients.bulk_write(operations[start:start + 1000], ordered=False)
+    stale_ids -= set(patients)
+    if stale_ids:
+        await db.patients.delete_many({"id": {"$in": list(stale_ids)}})
+    logger.info(f"Rebuilt {len(operations)} patients")
+    return len(operations)
+
+
+async def main():
+    database.connect()
+    try:
+        db = database.get_db()
+        await database.ensure_indexes(db)
+        await rebuild_patients(db)
+    finally:
+        database.close()
+
+if __name__ == "__main__":
+    load_dotenv(Path(__file__).parent / '.env')
+    asyncio.run(main())
@@ -0,0 +1,65 @@
+import os
+import logging
+from datetime import date, datetime, timedelta
+
+from email_outbox import enqueue_emails
+from scheduler import DailyJobScheduler
+
+logger = logging.getLogger(__name__)
+
+# Local hour at which reminders for the next day are queued
+REMINDER_HOUR = int(os.environ.get('REMINDER_HOUR', '18'))
+REMINDER_BATCH_SIZE = 200
+
+
+async def queue_next_day_reminders(db, today: date) -> int:
+    """
+    Queue reminder emails for every confirmed appointment on the day after
+    `today`. Appointments are read with one indexed query on (date, status)
+    and queued in batches of outbox inserts; the outbox worker then sends the
+    whole batch over a single SMTP session.
+    Returns the number of reminders queued
+    """
+    tomorrow = (today + timedelta(days=1)).isoformat()
+    cursor = db.appointments.find(
+        {
+            "date": tomorrow,
+            "status": "confirmed",
+            "email": {"$nin": [None, ""]},
+            "reminderQueuedAt": None,
+        },
+        {"_id": 0, "id": 1, "name": 1, "email": 1, "service": 1, "date": 1, "time": 1},
+    ).batch_size(REMINDER_BATCH_SIZE)
+
+    queued = 0
+    batch = []
+    async for appointment in cursor:
+        batch.append(appointment)
+        if len(batch) == REMINDER_BATCH_SIZE:
+            queued += await _queue_batch(db, batch)
+            batch = []
+    if batch:
+        queued += await _queue_batch(db, batch)
+    logger.info(f"Queued {queued} reminder emails for {tomorrow}")
+    return queued
+
+
+async def _queue_batch(db, appointments: list) -> int:
+    await enqueue_emails(db, [
+        ("appointment_reminder", appointment["email"], {
+            key: appointment.get(key) for key in ("id", "name", "service", "date", "time")
+        })
+        for appointment in appointments
+    ])
+    await db.appointments.update_many(
+        {"id": {"$in": [appointment["id"] for appointment in appointments]}},
+        {"$set": {"reminderQueuedAt": datetime.utcnow()}},
+    )
+    return len(appointments)
+
+
+class ReminderScheduler(DailyJobScheduler):
+    """Queues next-day reminders once a day at REMINDER_HOUR clinic time"""
+
+    def __init__(self, db, hour: int = REMINDER_HOUR):
+        super().__init__(db, "next_day_reminders", hour, queue_next_day_reminders)
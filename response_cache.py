@@ -0,0 +1,68 @@
+import hashlib
+import time
+from typing import Dict, Hashable, NamedTuple, Optional
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    etag: str
+    stored_at: float
+
+
+def make_etag(body: bytes) -> str:
+    """Strong ETag derived from the response body"""
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header against an ETag (weak comparison, per RFC 9110)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+class ResponseCache:
+    """
+    In-process cache of serialized response bodies, one entry per variant key.
+    Writers call invalidate(); entries also expire after ttl_seconds so that
+    other worker processes, which do not see the invalidation, converge.
+    A fill that started before an invalidation is discarded instead of
+    overwriting the fresh state.
+    """
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._entries: Dict[Hashable, CachedResponse] = {}
+        self._generation = 0
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, key: Hashable) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry.stored_at > self.ttl_seconds:
+            self._entries.pop(key, None)
+            return None
+        return entry
+
+    def set(self, key: Hashable, body: bytes, generation: int) -> CachedResponse:
+        """Store a body rendered from data read at `generation`"""
+        entry = CachedResponse(body=body, etag=make_etag(body), stored_at=time.monotonic())
+        if generation == self._generation:
+            self._entries[key] = entry
+        return entry
+
+    def invalidate(self) -> None:
+        self._generation += 1
+        self._entries.clear()
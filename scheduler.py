@@ -0,0 +1,68 @@
+import asyncio
+import os
+import logging
+from datetime import date, datetime, timedelta
+from typing import Awaitable, Callable, Optional
+from zoneinfo import ZoneInfo
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+CLINIC_TIMEZONE = ZoneInfo(os.environ.get('CLINIC_TIMEZONE', 'Asia/Kolkata'))
+
+
+class DailyJobScheduler:
+    """
+    Background task that runs `job(db, today)` once a day at `hour` clinic
+    time. Each day's run is claimed in the job_runs collection first, so
+    several API workers never run it twice.
+    """
+
+    def __init__(self, db, name: str, hour: int, job: Callable[..., Awaitable[int]]):
+        self.db = db
+        self.name = name
+        self.hour = hour
+        self.job = job
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            now = datetime.now(CLINIC_TIMEZONE)
+            run_at = now.replace(hour=self.hour, minute=0, second=0, microsecond=0)
+            if now >= run_at:
+                try:
+                    await self.run_once(now.date())
+                    run_at += timedelta(days=1)
+                except Exception as e:
+                    logger.error(f"Job {self.name} failed: {str(e)}")
+                    run_at = now + timedelta(minutes=5)
+            delay = (run_at - datetime.now(CLINIC_TIMEZONE)).total_seconds()
+            await asyncio.sleep(max(delay, 1))
+
+    async def run_once(self, today: date) -> int:
+        """Run the job for `today` unless already done"""
+        run_id = f"{self.name}:{today.isoformat()}"
+        try:
+            await self.db.job_runs.insert_one({"_id": run_id, "startedAt": datetime.utcnow()})
+        except DuplicateKeyError:
+            return 0
+        try:
+            return await self.job(self.db, today)
+        except Exception:
+            # Release the claim so the next attempt can pick up where this
+            # one stopped; jobs must skip work that is already done
+            await self.db.job_runs.delete_one({"_id": run_id})
+            raise
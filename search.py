@@ -0,0 +1,160 @@
+import asyncio
+import re
+import logging
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+from dotenv import load_dotenv
+from pymongo import UpdateOne
+import database
+
+logger = logging.getLogger(__name__)
+
+# Candidates read per collection before ranking; deeper pages are not useful
+# for finding a patient
+MAX_SEARCH_CANDIDATES = 200
+BACKFILL_BATCH_SIZE = 1000
+
+# Normalized copies of the searchable fields, stored on every appointment
+SEARCH_FIELDS = ("phoneDigits", "emailLower", "nameWords")
+
+PHONE_QUERY = re.compile(r"^[\d\s()+.-]+$")
+
+
+# National numbers are 10 digits; longer ones carry a trunk 0 or the 91
+# country code, e.g. "+91 98765 43210" and "098765 43210"
+NATIONAL_NUMBER_DIGITS = 10
+NATIONAL_PREFIXES = ("0", "91")
+
+
+def normalize_phone(phone: Optional[str]) -> str:
+    """Canonical national number: digits only, without trunk or country prefix"""
+    digits = re.sub(r"\D", "", phone or "")
+    while len(digits) > NATIONAL_NUMBER_DIGITS:
+        prefix = next((p for p in NATIONAL_PREFIXES if digits.startswith(p)), None)
+        if prefix is None:
+            break
+        digits = digits[len(prefix):]
+    return digits
+
+
+def normalize_phone_prefix(q: str) -> str:
+    """
+    Canonical start of a partly typed phone number: a typed country code or
+    trunk 0 is dropped even though the number is not complete yet
+    """
+    q = q.strip()
+    digits = re.sub(r"\D", "", q)
+    if q.startswith("+") or digits.startswith("00"):
+        digits = digits.lstrip("0")
+        if digits.startswith("91"):
+            digits = digits[2:]
+    elif digits.startswith("0"):
+        digits = digits[1:]
+    return normalize_phone(digits)
+
+
+def name_words(name: Optional[str]) -> List[str]:
+    return re.findall(r"\w+", (name or "").lower())
+
+
+def search_fields(appointment: dict) -> dict:
+    """Search keys for an appointment document, to be stored alongside it"""
+    email = (appointment.get("email") or "").strip().lower()
+    return {
+        "phoneDigits": normalize_phone(appointment.get("phone")),
+        "emailLower": email or None,
+        "nameWords": name_words(appointment.get("name")),
+    }
+
+
+def with_search_fields(appointment: dict) -> dict:
+    return {**appointment, **search_fields(appointment)}
+
+
+def _prefix(value: str) -> dict:
+    # An anchored, case-sensitive regex is answered from the index range
+    return {"$regex": f"^{re.escape(value)}"}
+
+
+def build_search(q: str) -> Tuple[dict, dict, Callable[[dict], int]]:
+    """
+    Turn a search string into Mongo filters and a relevance function.
+    Phone-like input matches phone digits by prefix, input with '@' matches
+    email by prefix, and anything else matches names word by word (each
+    query word a prefix of some name word) or the email. Relevance is 3 for
+    an exact match, 2 for a prefix of the whole value and 1 otherwise.
+    Returns (exact filter, match filter, relevance): the exact filter finds
+    the relevance 3 matches by equality, so they can be read first.
+    Raises ValueError if there is nothing to search for.
+    """
+    q = q.strip()
+    digits = normalize_phone_prefix(q)
+    if PHONE_QUERY.match(q) and len(digits) >= 3:
+        return (
+            {"phoneDigits": digits},
+            {"phoneDigits": _prefix(digits)},
+            lambda a: 3 if a.get("phoneDigits") == digits else 2,
+        )
+
+    if "@" in q:
+        email = q.lower()
+        return (
+            {"emailLower": email},
+            {"emailLower": _prefix(email)},
+            lambda a: 3 if a.get("emailLower") == email else 2,
+        )
+
+    words = name_words(q)
+    if not words:
+        raise ValueError("Search for a name, phone number or email")
+    query = {"$or": [
+        {"$and": [{"nameWords": _prefix(word)} for word in words]},
+        {"emailLower": _prefix(q.lower())},
+    ]}
+
+    def relevance(appointment: dict) -> int:
+        stored = appointment.get("nameWords") or []
+        if stored == words:
+            return 3
+        return 2 if " ".join(stored).startswith(" ".join(words)) else 1
+    return {"nameWords": words}, query, relevance
+
+
+async def backfill_search_fields(db, collection_name: str = "appointments") -> int:
+    """
+    Store search keys on appointments created before they existed, and
+    re-key any whose stored keys no longer match the current normalization
+    """
+    collection = db[collection_name]
+    cursor = collection.find(
+        {}, {"_id": 0, "id": 1, "name": 1, "phone": 1, "email": 1, **{field: 1 for field in SEARCH_FIELDS}}
+    ).batch_size(BACKFILL_BATCH_SIZE)
+    updated = 0
+    batch = []
+    async for appointment in cursor:
+        fields = search_fields(appointment)
+        if all(appointment.get(field) == value for field, value in fields.items()):
+            continue
+        batch.append(UpdateOne({"id": appointment["id"]}, {"$set": fields}))
+        if len(batch) == BACKFILL_BATCH_SIZE:
+            updated += (await collection.bulk_write(batch, ordered=False)).modified_count
+            batch = []
+    if batch:
+        updated += (await collection.bulk_write(batch, ordered=False)).modified_count
+    logger.info(f"Backfilled search fields on {updated} documents in {collection_name}")
+    return updated
+
+
+async def main():
+    database.connect()
+    try:
+        db = database.get_db()
+        await database.ensure_indexes(db)
+        await backfill_search_fields(db, "appointments")
+        await backfill_search_fields(db, "appointments_archive")
+    finally:
+        database.close()
+
+if __name__ == "__main__":
+    load_dotenv(Path(__file__).parent / '.env')
+    asyncio.run(main())
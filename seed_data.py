@@ -1,16 +1,44 @@
+"""
+Bulk data tool for the clinic database.
+
+    python seed_data.py gallery                              # default gallery images
+    python seed_data.py bootstrap-admin                      # default admin account
+    python seed_data.py import appointments bookings.csv     # JSONL or CSV, by extension
+    python seed_data.py import gallery images.jsonl --batch-size 500
+    python seed_data.py import admins admins.csv             # username + password or password_hash
+    python seed_data.py export appointments backup.jsonl
+    python seed_data.py generate 100000                      # synthetic appointments
+    python seed_data.py rebuild                              # stats, slot occupancy and patients
+
+Imports read the file as a stream and write it in batches. After every
+batch the number of records done is saved to <file>.checkpoint, so an
+interrupted import resumes where it stopped; --restart ignores it.
+"""
 import asyncio
-from motor.motor_asyncio import AsyncIOMotorClient
-import os
-from dotenv import load_dotenv
+import csv
+import hashlib
+import json
+import random
+import uuid
+import logging
+from datetime import date, datetime, timedelta
+from enum import Enum
 from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import orjson
+import typer
+from dotenv import load_dotenv
+from pydantic import ValidationError
+from pymongo import ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+import database
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+cli = typer.Typer(help="Bulk import, export and generation of clinic data.", add_completion=False)
 
 # Initial gallery images
 initial_images = [
@@ -58,22 +86,366 @@ initial_images = [
     }
 ]
 
-async def seed_gallery():
-    # Check if gallery already has images
-    count = await db.gallery_images.count_documents({})
-    if count > 0:
-        print(f"Gallery already has {count} images. Skipping seed.")
-        return
-    
-    # Insert initial images
-    await db.gallery_images.insert_many(initial_images)
-    print(f"Successfully seeded {len(initial_images)} gallery images!")
-
-async def main():
+SYNTHETIC_SERVICES = ["Dental Cleaning", "Root Canal", "Teeth Whitening", "Braces Consultation", "Tooth Extraction"]
+
+# Namespace for ids derived from the source file's content hash and the
+# record number, so importing the same file twice does not create the same
+# record twice, while different files never share ids
+IMPORT_ID_NAMESPACE = uuid.UUID("6f1c2b5e-3d4a-4f8e-9a7b-2c1d0e9f8a6b")
+
+
+class Collection(str, Enum):
+    appointments = "appointments"
+    gallery = "gallery"
+    admins = "admins"
+
+
+class ExportCollection(str, Enum):
+    appointments = "appointments"
+    gallery = "gallery"
+
+
+def file_format(path: Path) -> str:
+    suffix = path.suffix.lower()
+    if suffix in (".jsonl", ".ndjson"):
+        return "jsonl"
+    if suffix == ".csv":
+        return "csv"
+    raise typer.BadParameter(f"Unsupported file type '{suffix}' (use .jsonl, .ndjson or .csv)")
+
+
+def read_records(path: Path, skip: int = 0) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """
+    Stream (record number, record) pairs from a JSONL or CSV file, skipping
+    the first `skip` records without parsing them. Empty CSV cells are None.
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        if file_format(path) == "csv":
+            reader = csv.DictReader(f)
+            for number, row in enumerate(reader):
+                if number >= skip:
+                    yield number, {key: (value if value != "" else None) for key, value in row.items()}
+        else:
+            number = 0
+            for line in f:
+                if not line.strip():
+                    continue
+                if number >= skip:
+                    yield number, orjson.loads(line)
+                number += 1
+
+
+def file_digest(path: Path) -> str:
+    """SHA-256 of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Checkpoint:
+    """Progress of one import, stored next to the source file"""
+
+    def __init__(self, source: Path):
+        self.path = source.with_name(source.name + ".checkpoint")
+        self.source_hash = file_digest(source)
+
+    def load(self) -> int:
+        """Records already imported, or 0 if there is no checkpoint for this file"""
+        if not self.path.exists():
+            return 0
+        state = json.loads(self.path.read_text())
+        if state.get("sourceHash") != self.source_hash:
+            typer.echo(f"Ignoring {self.path.name}: the source file has changed since it was written")
+            return 0
+        return int(state["records"])
+
+    def save(self, records: int) -> None:
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(json.dumps({"sourceHash": self.source_hash, "records": records}))
+        tmp.replace(self.path)
+
+    def clear(self) -> None:
+        self.path.unlink(missing_ok=True)
+
+
+def appointment_document(record: Dict[str, Any], default_id: str) -> dict:
+    """
+    Validate an appointment the way the booking route does; raises
+    ValueError for a bad date or a time that is not a bookable slot
+    """
+    from server import Appointment
+    from availability import normalize_slot, parse_date
+    from patients import patient_id_for
+    from search import with_search_fields
+    appointment = Appointment(**{"id": default_id, **{k: v for k, v in record.items() if v is not None}})
+    parse_date(appointment.date)
+    if appointment.time:
+        appointment.time = normalize_slot(appointment.date, appointment.time)
+    appointment.patientId = appointment.patientId or patient_id_for(appointment.phone)
+    return with_search_fields(appointment.dict())
+
+
+def gallery_document(record: Dict[str, Any], default_id: str) -> dict:
+    from server import GalleryImage
+    return GalleryImage(**{"id": default_id, **{k: v for k, v in record.items() if v is not None}}).dict()
+
+
+def admin_document(record: Dict[str, Any], default_id: str) -> dict:
+    from auth_service import get_password_hash
+    username = (record.get("username") or "").strip()
+    if not username:
+        raise ValueError("username is required")
+    password_hash = record.get("password_hash")
+    if not password_hash:
+        if not record.get("password"):
+            raise ValueError("password or password_hash is required")
+        password_hash = get_password_hash(record["password"])
+    return {"username": username, "password_hash": password_hash}
+
+
+async def write_appointments(db, documents: List[dict]) -> Tuple[int, int]:
+    """
+    Insert a batch; records already present (same id) are skipped
+    Returns (inserted, skipped)
+    """
     try:
-        await seed_gallery()
-    finally:
-        client.close()
+        result = await db.appointments.insert_many(documents, ordered=False)
+        return len(result.inserted_ids), 0
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        unexpected = [error for error in errors if error.get("code") != 11000]
+        if unexpected:
+            raise
+        return e.details.get("nInserted", len(documents) - len(errors)), len(errors)
+
+
+async def write_gallery(db, documents: List[dict]) -> Tuple[int, int]:
+    """Upsert a batch; returns (written, unchanged)"""
+    result = await db.gallery_images.bulk_write(
+        [ReplaceOne({"id": document["id"]}, document, upsert=True) for document in documents], ordered=False
+    )
+    return result.upserted_count + result.modified_count, result.matched_count - result.modified_count
+
+
+async def write_admins(db, documents: List[dict]) -> Tuple[int, int]:
+    """Upsert a batch; returns (written, unchanged)"""
+    result = await db.admin_users.bulk_write([
+        UpdateOne(
+            {"username": document["username"]},
+            {"$set": {"password_hash": document["password_hash"]},
+             "$setOnInsert": {"created_at": datetime.utcnow().isoformat() + "Z"}},
+            upsert=True,
+        )
+        for document in documents
+    ], ordered=False)
+    return result.upserted_count + result.modified_count, result.matched_count - result.modified_count
+
+
+IMPORTERS = {
+    Collection.appointments: (appointment_document, write_appointments),
+    Collection.gallery: (gallery_document, write_gallery),
+    Collection.admins: (admin_document, write_admins),
+}
+
+
+async def import_file(db, collection: Collection, path: Path, batch_size: int, restart: bool) -> dict:
+    """Stream `path` into `collection` in batches, checkpointing after each batch"""
+    to_document, write_batch = IMPORTERS[collection]
+    checkpoint = Checkpoint(path)
+    done = 0 if restart else checkpoint.load()
+    if done:
+        typer.echo(f"Resuming after {done} records")
+
+    summary = {"read": 0, "written": 0, "skipped": 0, "rejected": 0}
+    batch: List[dict] = []
+
+    async def flush() -> None:
+        nonlocal batch
+        if batch:
+            written, skipped = await write_batch(db, batch)
+            summary["written"] += written
+            summary["skipped"] += skipped
+            batch = []
+        checkpoint.save(done + summary["read"])
+
+    for number, record in read_records(path, skip=done):
+        summary["read"] += 1
+        default_id = str(uuid.uuid5(IMPORT_ID_NAMESPACE, f"{checkpoint.source_hash}:{number}"))
+        try:
+            batch.append(to_document(record, default_id))
+        except (ValidationError, ValueError, TypeError) as e:
+            summary["rejected"] += 1
+            if summary["rejected"] <= 10:
+                typer.echo(f"Record {number + 1} rejected: {e}", err=True)
+        if summary["read"] % batch_size == 0:
+            await flush()
+    await flush()
+    checkpoint.clear()
+    return summary
+
+
+async def rebuild_derived(db) -> None:
+    """Recompute the counters, slot occupancy and patients, which bulk writes bypass"""
+    from availability import rebuild_slot_occupancy
+    from patients import rebuild_patients
+    from stats import rebuild_stats
+    await rebuild_stats(db)
+    await rebuild_slot_occupancy(db)
+    await rebuild_patients(db)
+
+
+def synthetic_appointment(rng: random.Random, days_ahead: int) -> dict:
+    from availability import slots_for_day
+
+    day = date.today() + timedelta(days=rng.randint(-days_ahead, days_ahead))
+    slots = slots_for_day(day)
+    number = rng.randint(1, 10 ** 6)
+    return {
+        "name": f"Patient {number}",
+        "phone": f"9{rng.randint(10 ** 8, 10 ** 9 - 1)}",
+        "email": f"patient{number}@example.com",
+        "date": day.isoformat(),
+        "time": rng.choice(slots) if slots else None,
+        "service": rng.choice(SYNTHETIC_SERVICES),
+        "status": rng.choices(["pending", "confirmed", "cancelled"], weights=[3, 6, 1])[0],
+        "createdAt": datetime.utcnow() - timedelta(seconds=rng.randint(0, days_ahead * 86400)),
+    }
+
+
+def run(coroutine_function, *args):
+    """Run a command against the configured database"""
+    async def main():
+        db = database.connect()
+        try:
+            await database.ensure_indexes(db)
+            return await coroutine_function(db, *args)
+        finally:
+            database.close()
+    return asyncio.run(main())
+
+
+@cli.command("import")
+def import_command(
+    collection: Collection,
+    path: Path = typer.Argument(..., exists=True, dir_okay=False, help="JSONL (.jsonl/.ndjson) or CSV file"),
+    batch_size: int = typer.Option(1000, min=1, help="Records per insert_many/bulk_write"),
+    restart: bool = typer.Option(False, help="Ignore an existing checkpoint and start from the first record"),
+    rebuild: bool = typer.Option(True, help="Rebuild stats, slot occupancy and patients after importing appointments"),
+):
+    """Import appointments, gallery images or admin users from a file"""
+    file_format(path)
+
+    async def command(db):
+        summary = await import_file(db, collection, path, batch_size, restart)
+        if collection == Collection.appointments and rebuild:
+            await rebuild_derived(db)
+        return summary
+
+    summary = run(command)
+    typer.echo(
+        f"Read {summary['read']}, wrote {summary['written']}, "
+        f"skipped {summary['skipped']} already present, rejected {summary['rejected']}"
+    )
+
+
+@cli.command("export")
+def export_command(
+    collection: ExportCollection,
+    path: Path = typer.Argument(..., dir_okay=False, help="Output file, .jsonl/.ndjson or .csv"),
+    batch_size: int = typer.Option(1000, min=1, help="Documents fetched per round trip"),
+):
+    """Export appointments or gallery images to a file that `import` accepts"""
+    from server import APPOINTMENT_PROJECTION, GALLERY_IMAGE_PROJECTION
+
+    fmt = file_format(path)
+    if collection == ExportCollection.appointments:
+        source, projection, order = "appointments", APPOINTMENT_PROJECTION, [("createdAt", 1), ("id", 1)]
+    else:
+        source, projection, order = "gallery_images", GALLERY_IMAGE_PROJECTION, [("createdAt", 1)]
+    fields = [field for field in projection if field != "_id"]
+
+    async def command(db):
+        written = 0
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=fields, extrasaction="ignore") if fmt == "csv" else None
+            if writer:
+                writer.writeheader()
+            async for document in db[source].find({}, projection).sort(order).batch_size(batch_size):
+                if writer:
+                    writer.writerow({
+                        key: value.isoformat() if isinstance(value, datetime) else value
+                        for key, value in document.items()
+                    })
+                else:
+                    f.write(orjson.dumps(document).decode() + "\n")
+                written += 1
+        return written
+
+    typer.echo(f"Exported {run(command)} documents to {path}")
+
+
+@cli.command("generate")
+def generate_command(
+    count: int = typer.Argument(..., min=1, help="Number of appointments to create"),
+    batch_size: int = typer.Option(1000, min=1, help="Appointments per insert_many"),
+    days: int = typer.Option(90, min=1, help="Spread appointment dates this many days around today"),
+    seed: Optional[int] = typer.Option(None, help="Random seed, for repeatable data sets"),
+):
+    """Insert synthetic appointments for load testing"""
+    from patients import patient_id_for
+    from search import with_search_fields
+    from server import Appointment
+
+    rng = random.Random(seed)
+
+    async def command(db):
+        written = 0
+        for start in range(0, count, batch_size):
+            size = min(batch_size, count - start)
+            batch = []
+            for _ in range(size):
+                appointment = Appointment(**synthetic_appointment(rng, days))
+                appointment.patientId = patient_id_for(appointment.phone)
+                batch.append(with_search_fields(appointment.dict()))
+            written += await write_appointments(db, batch)
+        await rebuild_derived(db)
+        return written
+
+    typer.echo(f"Generated {run(command)} appointments")
+
+
+@cli.command("gallery")
+def gallery_command():
+    """Add the default gallery images (existing images with the same id are replaced)"""
+    from server import GalleryImage
+
+    async def command(db):
+        return await write_gallery(db, [GalleryImage(**image).dict() for image in initial_images])
+
+    run(command)
+    typer.echo(f"Seeded {len(initial_images)} gallery images")
+
+
+@cli.command("bootstrap-admin")
+def bootstrap_admin_command():
+    """Create the default admin account if there is no admin yet"""
+    from auth_service import ensure_default_admin
+
+    async def command(db):
+        return await ensure_default_admin()
+
+    typer.echo("Created the default admin account" if run(command) else "An admin account already exists")
+
+
+@cli.command("rebuild")
+def rebuild_command():
+    """Recompute appointment stats, slot occupancy and patients from the appointments"""
+    run(rebuild_derived)
+    typer.echo("Rebuilt appointment stats, slot occupancy and patients")
+
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    cli()
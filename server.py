@@ -1,29 +1,114 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, Depends, File, Form, HTTPException, Query, Request, Response, UploadFile
+from fastapi.responses import ORJSONResponse, PlainTextResponse, StreamingResponse
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
 import os
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field
-from typing import List, Optional, Dict
+from pydantic import BaseModel, Field, ValidationError
+from typing import Any, List, Optional, Dict
 import uuid
+import heapq
+import orjson
+import base64
+import csv
+import io
+import json
 from datetime import datetime
 from enum import Enum
-from email_service import send_appointment_confirmation_email
-from auth_service import verify_admin_credentials, change_admin_password, get_password_hash
+from email_service import get_smtp_settings
+from email_outbox import EmailOutboxWorker, enqueue_email, enqueue_emails
+from reminders import ReminderScheduler
+from archiver import ArchiveScheduler, merged_newest_first, sort_key
+from search import MAX_SEARCH_CANDIDATES, SEARCH_FIELDS, build_search, with_search_fields
+from patients import patient_id_for, record_bookings, record_deleted_appointment, record_visits
+from metrics import ADMIN_LOGIN_ATTEMPTS, REGISTRY, EventLoopLagMonitor, MetricsMiddleware
+from throttle import ip_throttle, username_throttle
+from stats import get_stats, record_created, record_deleted, record_status_changes
+from events import USE_CHANGE_STREAM, ChangeStreamRelay, event_stream, publish_appointment_event
+from response_cache import ResponseCache, etag_matches
+import gallery_storage
+from availability import (
+    SLOT_CAPACITY,
+    SLOT_HOLDING_STATUSES,
+    SLOT_MINUTES,
+    holds_slot,
+    month_availability,
+    normalize_slot,
+    parse_date,
+    release_slot,
+    reserve_slot,
+    reserve_slots,
+)
+import database
+from database import get_db
+from auth_service import (
+    verify_admin_credentials,
+    change_admin_password,
+    create_access_token,
+    ensure_default_admin,
+    require_admin,
+    require_admin_stream,
+)
 
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# Appointment list pagination
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Serialized gallery responses, invalidated by the gallery write routes
+gallery_cache = ResponseCache(ttl_seconds=float(os.environ.get('GALLERY_CACHE_TTL_SECONDS', '300')))
+GALLERY_CACHE_CONTROL = f"public, max-age={int(os.environ.get('GALLERY_MAX_AGE_SECONDS', '0'))}, must-revalidate"
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open the shared MongoDB pool and background workers for the app's lifetime"""
+    lag_monitor = EventLoopLagMonitor()
+    lag_monitor.start()
+    db = database.connect()
+    await database.ensure_indexes(db)
+    await ensure_default_admin()
+    email_outbox_worker = EmailOutboxWorker(db)
+    reminder_scheduler = ReminderScheduler(db)
+    # Without SMTP nothing would send them, so reminders are not queued either
+    if email_outbox_worker.start():
+        reminder_scheduler.start()
+    archive_scheduler = ArchiveScheduler(db)
+    archive_scheduler.start()
+    change_stream_relay = ChangeStreamRelay(db) if USE_CHANGE_STREAM else None
+    if change_stream_relay:
+        change_stream_relay.start()
+    try:
+        yield
+    finally:
+        if change_stream_relay:
+            await change_stream_relay.stop()
+        await archive_scheduler.stop()
+        await reminder_scheduler.stop()
+        await email_outbox_worker.stop()
+        database.close()
+        await lag_monitor.stop()
+
+# Appointment export streaming
+EXPORT_FIELDS = ["id", "name", "phone", "email", "date", "time", "service", "message", "status", "createdAt"]
+EXPORT_BATCH_SIZE = 500
+
+# Largest page of patient search results
+MAX_SEARCH_RESULTS = 100
+
+# Largest batch accepted by the bulk appointment routes
+MAX_BULK_ITEMS = 500
+# Ids of the latest bulk status batches kept on each appointment
+STATUS_BATCH_IDS_KEPT = 5
 
 # Create the main app without a prefix
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -34,6 +119,23 @@ class AppointmentStatus(str, Enum):
     pending = "pending"
     confirmed = "confirmed"
     cancelled = "cancelled"
+    completed = "completed"
+
+# Statuses an appointment may move to from each status
+ALLOWED_STATUS_TRANSITIONS = {
+    AppointmentStatus.pending: {AppointmentStatus.confirmed, AppointmentStatus.cancelled},
+    AppointmentStatus.confirmed: {AppointmentStatus.cancelled, AppointmentStatus.completed},
+    AppointmentStatus.cancelled: {AppointmentStatus.pending},
+    AppointmentStatus.completed: set(),
+}
+
+def statuses_allowed_to_become(target: AppointmentStatus) -> List[str]:
+    """Statuses from which an appointment may transition to `target`"""
+    return [source.value for source, targets in ALLOWED_STATUS_TRANSITIONS.items() if target in targets]
+
+class ExportFormat(str, Enum):
+    csv = "csv"
+    ndjson = "ndjson"
 
 class ImageCategory(str, Enum):
     clinic = "clinic"
@@ -62,11 +164,28 @@ class Appointment(BaseModel):
     service: str
     message: Optional[str] = None
     status: AppointmentStatus = AppointmentStatus.pending
+    patientId: Optional[str] = None
     createdAt: datetime = Field(default_factory=datetime.utcnow)
 
 class AppointmentStatusUpdate(BaseModel):
     status: AppointmentStatus
 
+class AppointmentBulkStatusUpdate(BaseModel):
+    id: str
+    status: AppointmentStatus
+
+class BulkItemResult(BaseModel):
+    index: int
+    id: Optional[str] = None
+    success: bool
+    status: Optional[AppointmentStatus] = None
+    error: Optional[str] = None
+
+class BulkResult(BaseModel):
+    succeeded: int
+    failed: int
+    results: List[BulkItemResult]
+
 class GalleryImageCreate(BaseModel):
     url: str
     title: str
@@ -79,10 +198,28 @@ class GalleryImage(BaseModel):
     category: ImageCategory
     createdAt: datetime = Field(default_factory=datetime.utcnow)
 
+class Patient(BaseModel):
+    id: str
+    name: str
+    phone: str
+    email: Optional[str] = None
+    appointmentCount: int = 0
+    visitCount: int = 0
+    lastAppointmentDate: Optional[str] = None
+    lastVisit: Optional[str] = None
+    createdAt: datetime
+
 class AdminLogin(BaseModel):
     username: str
     password: str
 
+class AdminLoginResponse(BaseModel):
+    success: bool
+    message: str
+    access_token: str
+    token_type: str = "bearer"
+    expires_in: int
+
 class AdminPasswordChange(BaseModel):
     username: str
     old_password: str
@@ -98,93 +235,775 @@ class EmailRequest(BaseModel):
     data: Dict[str, str]
 
 
+# Fast serialization of stored documents.
+# Rows read back from Mongo were validated by the models when they were
+# written, so list routes project just the model fields and encode the rows
+# with orjson instead of building and re-validating a model per document.
+def model_projection(model) -> Dict[str, int]:
+    projection = {field: 1 for field in model.model_fields}
+    projection["_id"] = 0
+    return projection
+
+def stored_field_defaults(model) -> Dict[str, Any]:
+    """
+    Every model field in declaration order, with its static default (or None).
+    Merging a row over this fills fields missing from older documents and
+    keeps the model's key order.
+    """
+    defaults = {}
+    for name, field in model.model_fields.items():
+        static_default = not field.is_required() and field.default_factory is None
+        defaults[name] = getattr(field.default, "value", field.default) if static_default else None
+    return defaults
+
+APPOINTMENT_PROJECTION = model_projection(Appointment)
+APPOINTMENT_DEFAULTS = stored_field_defaults(Appointment)
+GALLERY_IMAGE_PROJECTION = model_projection(GalleryImage)
+GALLERY_IMAGE_DEFAULTS = stored_field_defaults(GalleryImage)
+
+
+async def record_created_appointments(db, appointments: List[dict]) -> None:
+    """
+    Count stored appointments in the stats and patient records. A failure
+    is only logged: the appointments exist, so failing the request would
+    invite a retry that books them twice, and rebuild_stats /
+    rebuild_patients repair the drift.
+    """
+    try:
+        await record_created(db, appointments)
+        await record_bookings(db, appointments)
+    except Exception as e:
+        logger.error(f"Error recording {len(appointments)} created appointments: {str(e)}")
+
+
+async def record_applied_status_changes(db, status_changes: List[tuple], completed: List[dict]) -> None:
+    """
+    Count applied status changes and completed visits. Like
+    record_created_appointments, a failure is only logged: the changes are
+    stored, and a retry would be a no-op that never sends the confirmation.
+    """
+    try:
+        await record_status_changes(db, status_changes)
+        await record_visits(db, completed)
+    except Exception as e:
+        logger.error(f"Error recording {len(status_changes)} status changes: {str(e)}")
+
+
+async def record_deleted_appointment_counts(db, appointment: dict) -> None:
+    """Take a deleted appointment out of the stats and its patient; failures are only logged"""
+    try:
+        await record_deleted(db, appointment)
+        await record_deleted_appointment(db, appointment)
+    except Exception as e:
+        logger.error(f"Error recording deleted appointment {appointment.get('id')}: {str(e)}")
+
+
 # Appointment Routes
 @api_router.post("/appointments", response_model=Appointment)
 async def create_appointment(appointment_data: AppointmentCreate):
+    """
+    Book an appointment.
+    When a time is given it must be a bookable slot with a free place; the
+    place is taken atomically before the appointment is stored.
+    """
     appointment = Appointment(**appointment_data.dict())
-    await db.appointments.insert_one(appointment.dict())
+    appointment.patientId = patient_id_for(appointment.phone)
+    db = get_db()
+    try:
+        parse_date(appointment.date)
+        if appointment.time:
+            appointment.time = normalize_slot(appointment.date, appointment.time)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if appointment.time and not await reserve_slot(db, appointment.date, appointment.time):
+        raise HTTPException(status_code=409, detail="This time slot is fully booked")
+    try:
+        await db.appointments.insert_one(with_search_fields(appointment.dict()))
+    except Exception:
+        if appointment.time:
+            await release_slot(db, appointment.date, appointment.time)
+        raise
+    await record_created_appointments(db, [appointment.dict()])
+    publish_appointment_event("created", appointment.dict())
     return appointment
 
-@api_router.get("/appointments", response_model=List[Appointment])
-async def get_appointments():
-    appointments = await db.appointments.find().sort("createdAt", -1).to_list(1000)
-    return [Appointment(**appointment) for appointment in appointments]
+@api_router.get("/appointments/events", dependencies=[Depends(require_admin_stream)])
+async def appointment_events_feed(request: Request, last_event_id: Optional[str] = None):
+    """
+    Server-sent events feed of appointment changes (created, status_changed,
+    deleted) for the admin panel. Reconnecting clients resume from the
+    Last-Event-ID header (or `last_event_id`); a `reset` event means the
+    gap could not be replayed and the list should be refetched.
+    """
+    resume_from = request.headers.get("last-event-id") or last_event_id
+    return StreamingResponse(
+        event_stream(resume_from),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@api_router.get("/stats", dependencies=[Depends(require_admin)])
+async def get_appointment_stats(
+    date_from: Optional[str] = Query(None, description="Earliest day to include in byDay (YYYY-MM-DD)"),
+    date_to: Optional[str] = Query(None, description="Latest day to include in byDay (YYYY-MM-DD)"),
+):
+    """
+    Appointment counts by status, service and day for the admin dashboard,
+    read from a counters document kept current by the appointment routes
+    """
+    return await get_stats(get_db(), date_from, date_to)
+
+@api_router.get("/availability")
+async def get_availability(month: str = Query(..., description="Month to show (YYYY-MM)")):
+    """Open places per slot for every day of a month"""
+    try:
+        days = await month_availability(get_db(), month)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"month": month, "slotMinutes": SLOT_MINUTES, "capacity": SLOT_CAPACITY, "days": days}
+
+def export_value(value: Any) -> Any:
+    """Convert a Mongo value into something csv/json can write"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+async def export_rows(cursor, export_format: ExportFormat):
+    """
+    Encode appointments from a Mongo cursor one batch at a time, so memory
+    stays flat however many rows are exported
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if export_format == ExportFormat.csv:
+        writer.writerow(EXPORT_FIELDS)
+    rows = 0
+    async for appointment in cursor:
+        values = [export_value(appointment.get(field)) for field in EXPORT_FIELDS]
+        if export_format == ExportFormat.csv:
+            writer.writerow(values)
+        else:
+            buffer.write(json.dumps(dict(zip(EXPORT_FIELDS, values)), ensure_ascii=False))
+            buffer.write("\n")
+        rows += 1
+        if rows % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+@api_router.get("/appointments/export", dependencies=[Depends(require_admin)])
+async def export_appointments(
+    format: ExportFormat = ExportFormat.csv,
+    status: Optional[AppointmentStatus] = None,
+    service: Optional[str] = None,
+    date_from: Optional[str] = Query(None, description="Earliest appointment date (YYYY-MM-DD)"),
+    date_to: Optional[str] = Query(None, description="Latest appointment date (YYYY-MM-DD)"),
+    include_archive: bool = Query(False, description="Also export archived appointments"),
+):
+    """
+    Stream every matching appointment as CSV or NDJSON, newest first.
+    Rows are read from a Mongo cursor and written out as they arrive
+    instead of being collected in memory.
+    """
+    query = build_appointment_filter(status, service, date_from, date_to)
+    projection = {field: 1 for field in EXPORT_FIELDS}
+    projection["_id"] = 0
+    collections = [get_db().appointments] + ([get_db().appointments_archive] if include_archive else [])
+    cursors = [
+        collection.find(query, projection).sort([("createdAt", -1), ("id", -1)]).batch_size(EXPORT_BATCH_SIZE)
+        for collection in collections
+    ]
+    cursor = merged_newest_first(*cursors) if include_archive else cursors[0]
+    
+    media_type = "text/csv" if format == ExportFormat.csv else "application/x-ndjson"
+    filename = f"appointments-{datetime.utcnow():%Y%m%d}.{format.value}"
+    return StreamingResponse(
+        export_rows(cursor, format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+def email_data_from_appointment(appointment: dict) -> dict:
+    """Pick the fields the email templates need from an appointment document"""
+    return {key: appointment.get(key) for key in ("id", "name", "service", "date", "time")}
+
+def bulk_result(results: List[BulkItemResult]) -> BulkResult:
+    results.sort(key=lambda result: result.index)
+    succeeded = sum(1 for result in results if result.success)
+    return BulkResult(succeeded=succeeded, failed=len(results) - succeeded, results=results)
+
+@api_router.post("/appointments/bulk", response_model=BulkResult, dependencies=[Depends(require_admin)])
+async def create_appointments_bulk(items: List[Dict[str, Any]]):
+    """
+    Create many appointments with a single insert_many.
+    Each item is validated on its own; invalid or rejected items are
+    reported in the per-item results without failing the rest of the batch.
+    """
+    if len(items) > MAX_BULK_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BULK_ITEMS} appointments per batch")
+    
+    results: List[BulkItemResult] = []
+    documents = []
+    document_indexes = []
+    for index, item in enumerate(items):
+        try:
+            appointment = Appointment(**AppointmentCreate.model_validate(item).dict())
+            appointment.patientId = patient_id_for(appointment.phone)
+            parse_date(appointment.date)
+            if appointment.time:
+                appointment.time = normalize_slot(appointment.date, appointment.time)
+        except (ValidationError, ValueError) as e:
+            results.append(BulkItemResult(index=index, success=False, error=str(e)))
+            continue
+        documents.append(appointment.dict())
+        document_indexes.append(index)
+    
+    db = get_db()
+    slotted = [position for position, document in enumerate(documents) if document["time"]]
+    reserved = await reserve_slots(db, [(documents[p]["date"], documents[p]["time"]) for p in slotted])
+    failed_positions: Dict[int, str] = {
+        position: "This time slot is fully booked"
+        for position, ok in zip(slotted, reserved) if not ok
+    }
+    
+    to_insert = [position for position in range(len(documents)) if position not in failed_positions]
+    if to_insert:
+        try:
+            await db.appointments.insert_many(
+                [with_search_fields(documents[p]) for p in to_insert], ordered=False
+            )
+        except BulkWriteError as e:
+            for write_error in e.details.get("writeErrors", []):
+                position = to_insert[write_error["index"]]
+                failed_positions[position] = write_error.get("errmsg", "Write failed")
+                if documents[position]["time"]:
+                    await release_slot(db, documents[position]["date"], documents[position]["time"])
+        except Exception:
+            # Like the single-item route, give back every place taken for the batch
+            for position in to_insert:
+                if documents[position]["time"]:
+                    await release_slot(db, documents[position]["date"], documents[position]["time"])
+            raise
+    
+    created = [d for p, d in enumerate(documents) if p not in failed_positions]
+    await record_created_appointments(db, created)
+    for document in created:
+        document.pop("_id", None)
+        publish_appointment_event("created", document)
+    for position, document in enumerate(documents):
+        error = failed_positions.get(position)
+        results.append(BulkItemResult(
+            index=document_indexes[position],
+            id=document["id"],
+            success=error is None,
+            status=None if error else document["status"],
+            error=error,
+        ))
+    return bulk_result(results)
+
+@api_router.patch("/appointments/status", response_model=BulkResult, dependencies=[Depends(require_admin)])
+async def update_appointment_statuses_bulk(updates: List[AppointmentBulkStatusUpdate]):
+    """
+    Change the status of many appointments with a single bulk_write.
+    Every update follows the same transition rules as the single-item route.
+    Updates applied by this batch are tagged with a batch id so they can be
+    told apart from concurrent changes, and confirmations are queued for
+    email in one outbox insert.
+    """
+    if len(updates) > MAX_BULK_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BULK_ITEMS} updates per batch")
+    
+    results: List[BulkItemResult] = []
+    seen = set()
+    batch = []
+    for index, update in enumerate(updates):
+        if update.id in seen:
+            results.append(BulkItemResult(index=index, id=update.id, success=False, error="Duplicate id in batch"))
+            continue
+        seen.add(update.id)
+        batch.append((index, update))
+    if not batch:
+        return bulk_result(results)
+    
+    db = get_db()
+    ids = [update.id for _, update in batch]
+    current = {
+        appointment["id"]: appointment
+        async for appointment in db.appointments.find(
+            {"id": {"$in": ids}}, {"_id": 0, "id": 1, "status": 1, "date": 1, "time": 1}
+        )
+    }
+    
+    # Work out which updates are valid transitions, reserving slots for
+    # appointments that start holding one again
+    planned = []
+    to_reserve = []
+    for index, update in batch:
+        appointment = current.get(update.id)
+        if appointment is None:
+            results.append(BulkItemResult(index=index, id=update.id, success=False, error="Appointment not found"))
+        elif appointment["status"] == update.status.value:
+            # Already in the requested status: nothing to do and nothing to send
+            results.append(BulkItemResult(index=index, id=update.id, success=True, status=update.status))
+        elif appointment["status"] not in statuses_allowed_to_become(update.status):
+            results.append(BulkItemResult(
+                index=index,
+                id=update.id,
+                success=False,
+                status=appointment["status"],
+                error=f"Cannot change status from {appointment['status']} to {update.status.value}",
+            ))
+        else:
+            planned.append((index, update))
+            if not holds_slot(appointment) and holds_slot({**appointment, "status": update.status.value}):
+                to_reserve.append(update.id)
+    
+    reserved_ok = await reserve_slots(db, [(current[i]["date"], current[i]["time"]) for i in to_reserve])
+    reserved = {appointment_id for appointment_id, ok in zip(to_reserve, reserved_ok) if ok}
+    full = set(to_reserve) - reserved
+    for index, update in planned:
+        if update.id in full:
+            results.append(BulkItemResult(
+                index=index, id=update.id, success=False, error="The time slot for this appointment is fully booked"
+            ))
+    planned = [(index, update) for index, update in planned if update.id not in full]
+    if not planned:
+        return bulk_result(results)
+    
+    # Each update only applies if the appointment is still in the status it
+    # was read in; applied updates are tagged with the batch id. The last
+    # few batch ids are kept, so a later batch changing the appointment
+    # again before the read below does not hide this batch's update
+    batch_id = str(uuid.uuid4())
+    status_by_id = {update.id: update.status.value for _, update in planned}
+    await db.appointments.bulk_write([
+        UpdateOne(
+            {"id": update.id, "status": current[update.id]["status"]},
+            {
+                "$set": {"status": update.status.value},
+                "$push": {"statusBatchIds": {"$each": [batch_id], "$slice": -STATUS_BATCH_IDS_KEPT}},
+            },
+        )
+        for _, update in planned
+    ], ordered=False)
+    applied = {
+        appointment["id"]: {**appointment, "status": status_by_id[appointment["id"]]}
+        async for appointment in db.appointments.find(
+            {"id": {"$in": list(status_by_id)}, "statusBatchIds": batch_id}, {"_id": 0, "statusBatchIds": 0}
+        )
+    }
+    
+    confirmation_emails = []
+    status_changes = []
+    completed = []
+    for index, update in planned:
+        previous = current[update.id]
+        if update.id not in applied:
+            if update.id in reserved:
+                await release_slot(db, previous["date"], previous["time"])
+            results.append(BulkItemResult(
+                index=index, id=update.id, success=False, error="Appointment was changed concurrently"
+            ))
+            continue
+        appointment = applied[update.id]
+        if holds_slot(previous) and not holds_slot(appointment):
+            await release_slot(db, previous["date"], previous["time"])
+        status_changes.append((previous["status"], update.status.value))
+        publish_appointment_event("status_changed", {
+            "id": update.id, "status": update.status.value, "previousStatus": previous["status"]
+        })
+        results.append(BulkItemResult(index=index, id=update.id, success=True, status=update.status))
+        if update.status == AppointmentStatus.completed:
+            completed.append(appointment)
+        if update.status == AppointmentStatus.confirmed and appointment.get("email"):
+            confirmation_emails.append(
+                ("appointment_confirmation", appointment["email"], email_data_from_appointment(appointment))
+            )
+    await record_applied_status_changes(db, status_changes, completed)
+    
+    if confirmation_emails and get_smtp_settings():
+        try:
+            await enqueue_emails(db, confirmation_emails)
+            logger.info(f"Queued {len(confirmation_emails)} confirmation emails for batch {batch_id}")
+        except Exception as e:
+            # Don't fail the request if email fails
+            logger.error(f"Error queueing emails for batch {batch_id}: {str(e)}")
+    return bulk_result(results)
+
+def encode_cursor(appointment: dict) -> str:
+    """Encode the sort key of the last appointment on a page as an opaque cursor"""
+    payload = json.dumps({
+        "createdAt": appointment["createdAt"].isoformat(),
+        "id": appointment["id"],
+    })
+    return base64.urlsafe_b64encode(payload.encode()).decode()
 
-@api_router.patch("/appointments/{appointment_id}/status", response_model=Appointment)
+def decode_cursor(cursor: str) -> dict:
+    """Decode a cursor produced by encode_cursor"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return {
+            "createdAt": datetime.fromisoformat(payload["createdAt"]),
+            "id": str(payload["id"]),
+        }
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def build_appointment_filter(
+    status: Optional[AppointmentStatus] = None,
+    service: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+) -> dict:
+    """Build a Mongo filter from the appointment list query parameters"""
+    query: Dict[str, Any] = {}
+    if status:
+        query["status"] = status.value
+    if service:
+        query["service"] = service
+    if date_from or date_to:
+        query["date"] = {}
+        if date_from:
+            query["date"]["$gte"] = date_from
+        if date_to:
+            query["date"]["$lte"] = date_to
+    return query
+
+@api_router.get("/appointments", response_class=ORJSONResponse, dependencies=[Depends(require_admin)])
+async def get_appointments(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    status: Optional[AppointmentStatus] = None,
+    service: Optional[str] = None,
+    date_from: Optional[str] = Query(None, description="Earliest appointment date (YYYY-MM-DD)"),
+    date_to: Optional[str] = Query(None, description="Latest appointment date (YYYY-MM-DD)"),
+    fields: Optional[str] = Query(None, description="Comma-separated list of fields to return"),
+    include_archive: bool = Query(False, description="Also list archived appointments"),
+):
+    """
+    List appointments newest first, one page at a time.
+    Pages are fetched with keyset pagination on (createdAt, id): pass the
+    X-Next-Cursor header of a response as `cursor` to get the next page.
+    With include_archive, a page of each collection is read and the two are
+    merged, so the same cursor works across both.
+    """
+    query = build_appointment_filter(status, service, date_from, date_to)
+    if cursor:
+        after = decode_cursor(cursor)
+        query["$or"] = [
+            {"createdAt": {"$lt": after["createdAt"]}},
+            {"createdAt": after["createdAt"], "id": {"$lt": after["id"]}},
+        ]
+
+    projection = APPOINTMENT_PROJECTION
+    requested_fields = None
+    if fields:
+        requested_fields = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = set(requested_fields) - set(Appointment.model_fields)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+        # The sort keys are always needed to build the next cursor
+        projection = {field: 1 for field in set(requested_fields) | {"id", "createdAt"}}
+        projection["_id"] = 0
+
+    collections = [get_db().appointments] + ([get_db().appointments_archive] if include_archive else [])
+    pages = [
+        await collection.find(query, projection).sort([("createdAt", -1), ("id", -1)]).limit(limit).to_list(limit)
+        for collection in collections
+    ]
+    appointments = pages[0] if len(pages) == 1 else list(
+        heapq.merge(*pages, key=sort_key, reverse=True)
+    )[:limit]
+
+    headers = {}
+    if len(appointments) == limit:
+        headers["X-Next-Cursor"] = encode_cursor(appointments[-1])
+
+    if requested_fields is None:
+        content = [{**APPOINTMENT_DEFAULTS, **appointment} for appointment in appointments]
+    else:
+        content = [{field: appointment.get(field) for field in requested_fields} for appointment in appointments]
+    return ORJSONResponse(content, headers=headers)
+
+@api_router.patch("/appointments/{appointment_id}/status", response_model=Appointment, dependencies=[Depends(require_admin)])
 async def update_appointment_status(appointment_id: str, status_update: AppointmentStatusUpdate):
-    appointment = await db.appointments.find_one({"id": appointment_id})
-    if not appointment:
-        raise HTTPException(status_code=404, detail="Appointment not found")
+    """
+    Move an appointment to a new status in a single atomic update.
+    The update only matches while the appointment is in a status that may
+    transition to the requested one, so concurrent requests cannot both
+    apply the same transition.
+    """
+    db = get_db()
+    target = status_update.status
     
-    await db.appointments.update_one(
-        {"id": appointment_id},
-        {"$set": {"status": status_update.status.value}}
+    # An appointment that starts holding its slot again needs a free place
+    # first; only targets reachable from a non-holding status (today just
+    # pending, from cancelled) pay for the pre-read
+    reserved = None
+    if target.value in SLOT_HOLDING_STATUSES and any(
+        source not in SLOT_HOLDING_STATUSES for source in statuses_allowed_to_become(target)
+    ):
+        current = await db.appointments.find_one(
+            {"id": appointment_id}, {"_id": 0, "status": 1, "date": 1, "time": 1}
+        )
+        reopening = (
+            current is not None
+            and current["status"] in statuses_allowed_to_become(target)
+            and not holds_slot(current)
+            and holds_slot({**current, "status": target.value})
+        )
+        if reopening:
+            if not await reserve_slot(db, current["date"], current["time"]):
+                raise HTTPException(status_code=409, detail="The time slot for this appointment is fully booked")
+            reserved = current
+    
+    previous = await db.appointments.find_one_and_update(
+        {"id": appointment_id, "status": {"$in": statuses_allowed_to_become(target)}},
+        {"$set": {"status": target.value}},
+        projection={"_id": 0},
+        return_document=ReturnDocument.BEFORE,
     )
+    if not previous:
+        if reserved:
+            await release_slot(db, reserved["date"], reserved["time"])
+        # Only the failure path pays for a second read, to pick the right error
+        appointment = await db.appointments.find_one({"id": appointment_id}, {"_id": 0})
+        if not appointment:
+            raise HTTPException(status_code=404, detail="Appointment not found")
+        if appointment["status"] == target.value:
+            # Already in the requested status: nothing to do and nothing to send
+            return Appointment(**appointment)
+        raise HTTPException(
+            status_code=409,
+            detail=f"Cannot change status from {appointment['status']} to {target.value}",
+        )
     
-    updated_appointment = await db.appointments.find_one({"id": appointment_id})
+    updated_appointment = {**previous, "status": target.value}
+    if reserved and holds_slot(previous):
+        # The appointment already held its slot after all
+        await release_slot(db, reserved["date"], reserved["time"])
+    elif holds_slot(previous) and not holds_slot(updated_appointment):
+        await release_slot(db, previous["date"], previous["time"])
+    await record_applied_status_changes(
+        db,
+        [(previous["status"], target.value)],
+        [updated_appointment] if target == AppointmentStatus.completed else [],
+    )
+    publish_appointment_event("status_changed", {
+        "id": appointment_id, "status": target.value, "previousStatus": previous["status"]
+    })
     
-    # Send confirmation email if status is confirmed and email exists
-    if status_update.status.value == "confirmed" and updated_appointment.get("email"):
+    # Queue confirmation email if the appointment was just confirmed, email
+    # exists and SMTP is configured to send it
+    if target == AppointmentStatus.confirmed and updated_appointment.get("email") and get_smtp_settings():
         try:
-            email_sent = send_appointment_confirmation_email(
-                appointment_data=updated_appointment,
-                recipient_email=updated_appointment["email"]
+            await enqueue_email(
+                db,
+                "appointment_confirmation",
+                updated_appointment["email"],
+                email_data_from_appointment(updated_appointment),
             )
-            if email_sent:
-                logger.info(f"Confirmation email sent for appointment {appointment_id}")
-            else:
-                logger.warning(f"Email not sent for appointment {appointment_id} - SMTP not configured")
+            logger.info(f"Confirmation email queued for appointment {appointment_id}")
         except Exception as e:
             # Don't fail the request if email fails
-            logger.error(f"Error sending email for appointment {appointment_id}: {str(e)}")
+            logger.error(f"Error queueing email for appointment {appointment_id}: {str(e)}")
     
     return Appointment(**updated_appointment)
 
-@api_router.delete("/appointments/{appointment_id}")
+@api_router.delete("/appointments/{appointment_id}", dependencies=[Depends(require_admin)])
 async def delete_appointment(appointment_id: str):
-    result = await db.appointments.delete_one({"id": appointment_id})
-    if result.deleted_count == 0:
+    db = get_db()
+    deleted = await db.appointments.find_one_and_delete(
+        {"id": appointment_id},
+        projection={"_id": 0, "status": 1, "date": 1, "time": 1, "service": 1, "patientId": 1},
+    )
+    if not deleted:
         raise HTTPException(status_code=404, detail="Appointment not found")
+    if holds_slot(deleted):
+        await release_slot(db, deleted["date"], deleted["time"])
+    await record_deleted_appointment_counts(db, {**deleted, "id": appointment_id})
+    publish_appointment_event("deleted", {"id": appointment_id})
     return {"message": "Appointment deleted successfully"}
 
 
+@api_router.get("/appointments/search", response_class=ORJSONResponse, dependencies=[Depends(require_admin)])
+async def search_appointments(
+    q: str = Query(..., min_length=1, description="Name, phone number or email, or the start of one"),
+    limit: int = Query(20, ge=1, le=MAX_SEARCH_RESULTS),
+    offset: int = Query(0, ge=0, lt=MAX_SEARCH_CANDIDATES),
+    include_archive: bool = Query(False, description="Also search archived appointments"),
+):
+    """
+    Find appointments by patient name, phone or email, best matches first.
+    Matching uses the normalized search keys stored with each appointment;
+    results are ranked by relevance, then newest first. Exact matches are
+    read first, so older ones are not crowded out by newer partial matches.
+    At most MAX_SEARCH_CANDIDATES results are reachable; pass the
+    X-Next-Offset header of a response as `offset` to get the next page.
+    """
+    try:
+        exact_query, query, relevance = build_search(q)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    projection = {**APPOINTMENT_PROJECTION, **{field: 1 for field in SEARCH_FIELDS}}
+    collections = [get_db().appointments] + ([get_db().appointments_archive] if include_archive else [])
+    candidates = {}
+    for collection in collections:
+        for candidate_query in (exact_query, query):
+            matches = await collection.find(candidate_query, projection).sort(
+                [("createdAt", -1), ("id", -1)]
+            ).limit(MAX_SEARCH_CANDIDATES).to_list(MAX_SEARCH_CANDIDATES)
+            for appointment in matches:
+                candidates.setdefault(appointment["id"], appointment)
+    ranked = sorted(
+        candidates.values(), key=lambda appointment: (relevance(appointment), sort_key(appointment)), reverse=True
+    )[:MAX_SEARCH_CANDIDATES]
+
+    page = ranked[offset:offset + limit]
+    headers = {}
+    if offset + limit < len(ranked):
+        headers["X-Next-Offset"] = str(offset + limit)
+    content = [
+        {field: appointment.get(field, default) for field, default in APPOINTMENT_DEFAULTS.items()}
+        for appointment in page
+    ]
+    return ORJSONResponse(content, headers=headers)
+
+
+# Patient Routes
+@api_router.get("/patients/lookup", response_model=Patient, dependencies=[Depends(require_admin)])
+async def lookup_patient(phone: str = Query(..., description="Phone number in any format")):
+    """Find a returning patient by phone number with a single read by id"""
+    patient_id = patient_id_for(phone)
+    patient = await get_db().patients.find_one({"id": patient_id}, {"_id": 0}) if patient_id else None
+    if not patient:
+        raise HTTPException(status_code=404, detail="Patient not found")
+    return Patient(**patient)
+
+@api_router.get("/patients/{patient_id}", response_model=Patient, dependencies=[Depends(require_admin)])
+async def get_patient(patient_id: str):
+    patient = await get_db().patients.find_one({"id": patient_id}, {"_id": 0})
+    if not patient:
+        raise HTTPException(status_code=404, detail="Patient not found")
+    return Patient(**patient)
+
+@api_router.get("/patients/{patient_id}/appointments", response_class=ORJSONResponse, dependencies=[Depends(require_admin)])
+async def get_patient_appointments(
+    patient_id: str,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+):
+    """
+    A patient's appointments newest first, archived ones included.
+    Each collection answers from its (patientId, createdAt, id) index; pages
+    work like GET /appointments, with the X-Next-Cursor header.
+    """
+    query: Dict[str, Any] = {"patientId": patient_id}
+    if cursor:
+        after = decode_cursor(cursor)
+        query["$or"] = [
+            {"createdAt": {"$lt": after["createdAt"]}},
+            {"createdAt": after["createdAt"], "id": {"$lt": after["id"]}},
+        ]
+    pages = [
+        await collection.find(query, APPOINTMENT_PROJECTION).sort(
+            [("createdAt", -1), ("id", -1)]
+        ).limit(limit).to_list(limit)
+        for collection in (get_db().appointments, get_db().appointments_archive)
+    ]
+    appointments = list(heapq.merge(*pages, key=sort_key, reverse=True))[:limit]
+
+    headers = {}
+    if len(appointments) == limit:
+        headers["X-Next-Cursor"] = encode_cursor(appointments[-1])
+    return ORJSONResponse([{**APPOINTMENT_DEFAULTS, **appointment} for appointment in appointments], headers=headers)
+
+
 # Gallery Routes
 @api_router.get("/gallery", response_model=List[GalleryImage])
-async def get_gallery_images():
-    images = await db.gallery_images.find().sort("createdAt", -1).to_list(1000)
-    return [GalleryImage(**image) for image in images]
+async def get_gallery_images(request: Request, category: Optional[ImageCategory] = None):
+    """
+    List gallery images, newest first.
+    The serialized response is cached in-process until the gallery changes;
+    clients revalidating with If-None-Match get a 304.
+    """
+    cache_key = category.value if category else None
+    cached = gallery_cache.get(cache_key)
+    if cached is None:
+        generation = gallery_cache.generation
+        query = {"category": category.value} if category else {}
+        images = await get_db().gallery_images.find(query, GALLERY_IMAGE_PROJECTION).sort("createdAt", -1).to_list(1000)
+        body = orjson.dumps([{**GALLERY_IMAGE_DEFAULTS, **image} for image in images])
+        cached = gallery_cache.set(cache_key, body, generation)
+    
+    headers = {"ETag": cached.etag, "Cache-Control": GALLERY_CACHE_CONTROL}
+    if etag_matches(request.headers.get("if-none-match"), cached.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=cached.body, media_type="application/json", headers=headers)
 
-@api_router.post("/gallery", response_model=GalleryImage)
+@api_router.post("/gallery", response_model=GalleryImage, dependencies=[Depends(require_admin)])
 async def create_gallery_image(image_data: GalleryImageCreate):
     image = GalleryImage(**image_data.dict())
-    await db.gallery_images.insert_one(image.dict())
+    await get_db().gallery_images.insert_one(image.dict())
+    gallery_cache.invalidate()
     return image
 
-@api_router.delete("/gallery/{image_id}")
+@api_router.post("/gallery/upload", response_model=GalleryImage, dependencies=[Depends(require_admin)])
+async def upload_gallery_image(
+    file: UploadFile = File(...),
+    title: str = Form(...),
+    category: ImageCategory = Form(...),
+):
+    """
+    Upload an image file and add it to the gallery.
+    The file is written to local storage in chunks and stored once per
+    distinct content; the image's url points at the stored copy.
+    """
+    received = await gallery_storage.receive_upload(file)
+    async with gallery_storage.files_lock:
+        gallery_storage.store_received(received)
+        image = GalleryImage(url=gallery_storage.file_url(received.name), title=title, category=category)
+        # The stored file name is kept off the model; it is only needed to collect unused files
+        await get_db().gallery_images.insert_one({**image.dict(), "file": received.name})
+    gallery_cache.invalidate()
+    return image
+
+@api_router.get("/gallery/files/{name}")
+async def get_gallery_file(name: str, request: Request):
+    """Serve an uploaded image; file URLs are content-addressed and cached for good"""
+    return gallery_storage.serve_file(name, request)
+
+@api_router.delete("/gallery/{image_id}", dependencies=[Depends(require_admin)])
 async def delete_gallery_image(image_id: str):
-    result = await db.gallery_images.delete_one({"id": image_id})
-    if result.deleted_count == 0:
-        raise HTTPException(status_code=404, detail="Image not found")
+    """Delete a gallery image, removing its uploaded file once no image uses it"""
+    db = get_db()
+    async with gallery_storage.files_lock:
+        deleted = await db.gallery_images.find_one_and_delete({"id": image_id}, projection={"_id": 0, "file": 1})
+        if deleted is None:
+            raise HTTPException(status_code=404, detail="Image not found")
+        if deleted.get("file") and not await db.gallery_images.count_documents({"file": deleted["file"]}, limit=1):
+            gallery_storage.remove_file(deleted["file"])
+    gallery_cache.invalidate()
     return {"message": "Image deleted successfully"}
 
 
-@api_router.post("/send-email")
+@api_router.post("/send-email", dependencies=[Depends(require_admin)])
 async def send_email(request: EmailRequest):
     """
-    Send an email using the provided data and email address.
+    Queue an email using the provided data and email address.
+    The message is delivered in the background by the email outbox worker.
     """
+    if not get_smtp_settings():
+        raise HTTPException(status_code=500, detail="Email service not configured")
     try:
-        success = send_appointment_confirmation_email(
-            appointment_data=request.data,
-            recipient_email=request.email
-        )
-        if success:
-             return {"message": "Email sent successfully", "success": True}
-        else:
-             raise HTTPException(status_code=500, detail="Failed to send email")
+        outbox_id = await enqueue_email(get_db(), "appointment_confirmation", request.email, request.data)
     except Exception as e:
         logger.error(f"Error in /send-email: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+    return {"message": "Email queued", "success": True, "id": outbox_id}
 
 
 # Health check route
@@ -192,20 +1011,69 @@ async def send_email(request: EmailRequest):
 async def root():
     return {"message": "Happy Teeth Dental Clinic API", "status": "active"}
 
+@api_router.get("/ready")
+async def readiness():
+    """Readiness probe: succeeds only when the MongoDB pool can reach the server"""
+    if not await database.ping():
+        raise HTTPException(status_code=503, detail="Database unavailable")
+    return {"status": "ready"}
+
+# Only trust X-Forwarded-For when running behind a known reverse proxy
+TRUST_PROXY_HEADERS = os.environ.get('TRUST_PROXY_HEADERS', 'false').lower() == 'true'
+
+def client_ip(request: Request) -> str:
+    if TRUST_PROXY_HEADERS:
+        forwarded_for = request.headers.get("x-forwarded-for")
+        if forwarded_for:
+            return forwarded_for.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
 # Admin Authentication Routes
-@api_router.post("/admin/login")
-async def admin_login(credentials: AdminLogin):
-    """Verify admin credentials"""
+@api_router.post("/admin/login", response_model=AdminLoginResponse)
+async def admin_login(credentials: AdminLogin, request: Request):
+    """
+    Verify admin credentials and issue a short-lived bearer token
+    for the other admin routes.
+    Repeated failures lock out the client IP and the username from that
+    IP, so guessing from elsewhere cannot lock the admin out; locked-out
+    attempts are rejected with 429 before any password hashing.
+    """
+    ip_key = client_ip(request)
+    username_key = f"{credentials.username.strip().lower()}@{ip_key}"
+    retry_after = max(ip_throttle.retry_after(ip_key), username_throttle.retry_after(username_key))
+    if retry_after:
+        ADMIN_LOGIN_ATTEMPTS.inc(outcome="throttled")
+        raise HTTPException(
+            status_code=429,
+            detail="Too many failed login attempts. Try again later.",
+            headers={"Retry-After": str(int(retry_after) + 1)},
+        )
+    
     is_valid = await verify_admin_credentials(credentials.username, credentials.password)
     if not is_valid:
+        ip_throttle.record_failure(ip_key)
+        username_throttle.record_failure(username_key)
+        ADMIN_LOGIN_ATTEMPTS.inc(outcome="failure")
         raise HTTPException(status_code=401, detail="Invalid credentials")
-    return {"success": True, "message": "Login successful"}
+    ip_throttle.record_success(ip_key)
+    username_throttle.record_success(username_key)
+    ADMIN_LOGIN_ATTEMPTS.inc(outcome="success")
+    access_token, expires_in = create_access_token(credentials.username)
+    return AdminLoginResponse(
+        success=True,
+        message="Login successful",
+        access_token=access_token,
+        expires_in=expires_in,
+    )
 
 @api_router.post("/admin/change-password", response_model=AdminPasswordChangeResponse)
-async def admin_change_password(password_change: AdminPasswordChange):
+async def admin_change_password(password_change: AdminPasswordChange, admin: str = Depends(require_admin)):
     """
     Change admin password - now updates database directly
     """
+    if password_change.username != admin:
+        raise HTTPException(status_code=403, detail="Cannot change another admin's password")
+    
     success, message = await change_admin_password(
         password_change.old_password,
         password_change.new_password,
@@ -224,12 +1092,20 @@ async def admin_change_password(password_change: AdminPasswordChange):
 # Include the router in the main app
 app.include_router(api_router)
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus text exposition of the process metrics"""
+    return PlainTextResponse(REGISTRY.expose(), media_type="text/plain; version=0.0.4")
+
+app.add_middleware(MetricsMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Next-Offset", "ETag"],
 )
 
 # Configure logging
@@ -238,7 +1114,3 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
-
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
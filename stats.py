@@ -0,0 +1,128 @@
+import asyncio
+import logging
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+from dotenv import load_dotenv
+import database
+
+logger = logging.getLogger(__name__)
+
+# The single counters document in the appointment_stats collection
+STATS_ID = "appointments"
+
+
+def _encode_key(value: Optional[str]) -> str:
+    """Make a value usable as a Mongo field name ('.' and '$' are reserved)"""
+    if not value:
+        return "unknown"
+    # Enum members (e.g. an unsaved model's status) count under their value
+    value = getattr(value, "value", value)
+    return str(value).replace(".", "．").replace("$", "＄")
+
+
+def _decode_key(key: str) -> str:
+    return key.replace("．", ".").replace("＄", "$")
+
+
+def appointment_increments(appointment: dict, sign: int = 1) -> Counter:
+    """Counter increments contributed by one appointment"""
+    return Counter({
+        "total": sign,
+        f"byStatus.{_encode_key(appointment.get('status'))}": sign,
+        f"byService.{_encode_key(appointment.get('service'))}": sign,
+        f"byDay.{_encode_key(appointment.get('date'))}": sign,
+    })
+
+
+def status_change_increments(old_status: str, new_status: str) -> Counter:
+    return Counter({f"byStatus.{_encode_key(old_status)}": -1, f"byStatus.{_encode_key(new_status)}": 1})
+
+
+async def apply_increments(db, increments: Counter) -> None:
+    """Apply summed counter changes with a single update"""
+    changes = {field: amount for field, amount in increments.items() if amount}
+    if not changes:
+        return
+    await db.appointment_stats.update_one({"_id": STATS_ID}, {"$inc": changes}, upsert=True)
+
+
+async def record_created(db, appointments: Iterable[dict]) -> None:
+    increments = Counter()
+    for appointment in appointments:
+        increments.update(appointment_increments(appointment))
+    await apply_increments(db, increments)
+
+
+async def record_deleted(db, appointment: dict) -> None:
+    await apply_increments(db, appointment_increments(appointment, sign=-1))
+
+
+async def record_status_changes(db, changes: Iterable[tuple]) -> None:
+    """Record (old_status, new_status) transitions"""
+    increments = Counter()
+    for old_status, new_status in changes:
+        increments.update(status_change_increments(old_status, new_status))
+    await apply_increments(db, increments)
+
+
+async def get_stats(db, date_from: Optional[str] = None, date_to: Optional[str] = None) -> dict:
+    """Read the counters document, optionally limiting byDay to a date range"""
+    document = await db.appointment_stats.find_one({"_id": STATS_ID}) or {}
+
+    def decoded(section: str) -> Dict[str, int]:
+        return {_decode_key(key): count for key, count in document.get(section, {}).items() if count}
+
+    by_day = {
+        day: count for day, count in sorted(decoded("byDay").items())
+        if (not date_from or day >= date_from) and (not date_to or day <= date_to)
+    }
+    return {
+        "total": document.get("total", 0),
+        "byStatus": decoded("byStatus"),
+        "byService": decoded("byService"),
+        "byDay": by_day,
+    }
+
+
+async def rebuild_stats(db) -> dict:
+    """
+    Recompute the counters with one aggregation per collection; archived
+    appointments keep counting, as they did before they were archived
+    """
+    totals = Counter()
+    for collection in (db.appointments, db.appointments_archive):
+        result = await collection.aggregate([
+            {"$facet": {
+                "total": [{"$count": "count"}],
+                "byStatus": [{"$group": {"_id": "$status", "count": {"$sum": 1}}}],
+                "byService": [{"$group": {"_id": "$service", "count": {"$sum": 1}}}],
+                "byDay": [{"$group": {"_id": "$date", "count": {"$sum": 1}}}],
+            }},
+        ]).to_list(1)
+        facets = result[0] if result else {}
+        totals["total"] += facets["total"][0]["count"] if facets.get("total") else 0
+        for section in ("byStatus", "byService", "byDay"):
+            for group in facets.get(section, []):
+                totals[(section, _encode_key(group["_id"]))] += group["count"]
+
+    document = {"_id": STATS_ID, "total": totals.pop("total", 0)}
+    for section in ("byStatus", "byService", "byDay"):
+        document[section] = {}
+    for (section, key), count in totals.items():
+        document[section][key] = count
+    await db.appointment_stats.replace_one({"_id": STATS_ID}, document, upsert=True)
+    logger.info(f"Rebuilt appointment stats for {document['total']} appointments")
+    return document
+
+
+async def main():
+    database.connect()
+    try:
+        await rebuild_stats(database.get_db())
+    finally:
+        database.close()
+
+if __name__ == "__main__":
+    load_dotenv(Path(__file__).parent / '.env')
+    asyncio.run(main())
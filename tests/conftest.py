@@ -0,0 +1,91 @@
+"""
+Boots server.app in-process through its lifespan against mongomock-motor,
+the same way benchmarks/run.py does, and logs in as the default admin.
+"""
+import os
+import sys
+from pathlib import Path
+
+import httpx
+import pytest
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+ADMIN_PASSWORD = "test-password"
+
+# The app reads these at import time
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ["DB_NAME"] = "clinic_test"
+os.environ["ADMIN_TOKEN_SECRET"] = "test-secret-" + "x" * 32
+os.environ["ADMIN_DEFAULT_PASSWORD"] = ADMIN_PASSWORD
+os.environ["SLOT_CAPACITY"] = "2"
+for name in ("SMTP_SERVER", "SMTP_EMAIL", "SMTP_PASSWORD"):
+    os.environ.pop(name, None)
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def app_client():
+    from mongomock_motor import AsyncMongoMockClient
+    import database
+    import server
+    from throttle import ip_throttle, username_throttle
+
+    for throttle in (ip_throttle, username_throttle):
+        throttle._states.clear()
+    server.gallery_cache.invalidate()
+    database.connect(client=AsyncMongoMockClient())
+    async with server.lifespan(server.app):
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            yield client
+
+
+@pytest.fixture
+def db(app_client):
+    import database
+    return database.get_db()
+
+
+@pytest.fixture
+async def admin_headers(app_client):
+    response = await app_client.post(
+        "/api/admin/login", json={"username": "admin", "password": ADMIN_PASSWORD}
+    )
+    assert response.status_code == 200
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+# A Monday; 10:00 is a bookable slot and SLOT_CAPACITY is 2 in the tests
+DAY = "2030-01-07"
+SLOT = "10:00"
+
+
+async def book(client, name="Patient", time=SLOT, day=DAY, **fields):
+    return await client.post("/api/appointments", json={
+        "name": name, "phone": "98765 43210", "date": day, "time": time, "service": "Cleaning", **fields,
+    })
+
+
+async def set_status(client, headers, appointment_id, status):
+    return await client.patch(
+        f"/api/appointments/{appointment_id}/status", json={"status": status}, headers=headers
+    )
+
+
+async def list_all(client, headers, **params):
+    """Names of every appointment listed, following X-Next-Cursor two at a time"""
+    names, cursor = [], None
+    while True:
+        page_params = {**params, "limit": 2, **({"cursor": cursor} if cursor else {})}
+        response = await client.get("/api/appointments", params=page_params, headers=headers)
+        assert response.status_code == 200
+        names += [appointment["name"] for appointment in response.json()]
+        cursor = response.headers.get("x-next-cursor")
+        if not cursor:
+            return names
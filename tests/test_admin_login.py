@@ -0,0 +1,90 @@
+import pytest
+
+import server
+from auth_service import get_password_hash
+from conftest import ADMIN_PASSWORD
+from throttle import SlidingWindowThrottle, username_throttle
+
+pytestmark = pytest.mark.anyio
+
+
+def test_throttle_locks_out_and_backs_off():
+    throttle = SlidingWindowThrottle(max_failures=3, window_seconds=60, base_lockout=10, max_lockout=15)
+    for now in (0, 1, 2):
+        assert throttle.retry_after("key", now=now) == 0
+        throttle.record_failure("key", now=now)
+    assert throttle.retry_after("key", now=2) == 10
+    assert throttle.retry_after("key", now=12) == 0
+
+    for now in (12, 13, 14):
+        throttle.record_failure("key", now=now)
+    # The second lockout doubles, capped at max_lockout
+    assert throttle.retry_after("key", now=14) == 15
+
+
+def test_throttle_forgets_failures_outside_the_window():
+    throttle = SlidingWindowThrottle(max_failures=2, window_seconds=60, base_lockout=10, max_lockout=10)
+    throttle.record_failure("key", now=0)
+    throttle.record_failure("key", now=61)
+    assert throttle.retry_after("key", now=61) == 0
+
+
+def test_success_resets_the_throttle():
+    throttle = SlidingWindowThrottle(max_failures=2, window_seconds=60, base_lockout=10, max_lockout=10)
+    throttle.record_failure("key", now=0)
+    throttle.record_success("key")
+    throttle.record_failure("key", now=1)
+    assert throttle.retry_after("key", now=1) == 0
+
+
+async def login(client, password, ip="203.0.113.1"):
+    return await client.post(
+        "/api/admin/login",
+        json={"username": "admin", "password": password},
+        headers={"X-Forwarded-For": ip},
+    )
+
+
+async def test_repeated_failures_lock_the_username_on_that_ip(app_client, monkeypatch):
+    monkeypatch.setattr(server, "TRUST_PROXY_HEADERS", True)
+    for _ in range(username_throttle.max_failures):
+        assert (await login(app_client, "wrong")).status_code == 401
+
+    response = await login(app_client, ADMIN_PASSWORD)
+    assert response.status_code == 429
+    assert int(response.headers["retry-after"]) > 0
+
+    # Guessing from one IP does not lock the admin out elsewhere
+    assert (await login(app_client, ADMIN_PASSWORD, ip="198.51.100.7")).status_code == 200
+
+
+async def test_successful_login_resets_failures(app_client, monkeypatch):
+    monkeypatch.setattr(server, "TRUST_PROXY_HEADERS", True)
+    for _ in range(username_throttle.max_failures - 1):
+        await login(app_client, "wrong")
+    assert (await login(app_client, ADMIN_PASSWORD)).status_code == 200
+    for _ in range(username_throttle.max_failures - 1):
+        await login(app_client, "wrong")
+    assert (await login(app_client, ADMIN_PASSWORD)).status_code == 200
+
+
+async def test_duplicate_admin_rows_are_collapsed_before_the_unique_index():
+    from mongomock_motor import AsyncMongoMockClient
+    from auth_service import verify_password
+    import database
+
+    db = AsyncMongoMockClient()["legacy"]
+    await db.admin_users.create_index("username")
+    await db.admin_users.insert_many([
+        {"username": "admin", "password_hash": get_password_hash("in-use")},
+        {"username": "admin", "password_hash": get_password_hash("admin123")},
+        {"username": "other", "password_hash": get_password_hash("other")},
+    ])
+
+    await database.ensure_indexes(db)
+
+    admins = await db.admin_users.find({"username": "admin"}).to_list(None)
+    assert len(admins) == 1
+    assert verify_password("in-use", admins[0]["password_hash"])
+    assert await db.admin_users.count_documents({}) == 2
+    assert (await db.admin_users.index_information())["username_1"]["unique"]
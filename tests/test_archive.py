@@ -0,0 +1,54 @@
+from datetime import date
+
+import pytest
+
+from archiver import ArchiveScheduler, archive_appointments
+from conftest import book, list_all, set_status
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_cursor_pages_merge_the_archive(app_client, admin_headers, db):
+    for index in range(5):
+        appointment = (await book(app_client, f"P{index}", time=None)).json()
+        if index % 2:
+            await set_status(app_client, admin_headers, appointment["id"], "cancelled")
+    assert await archive_appointments(db, date(2031, 1, 1)) == 2
+
+    assert await list_all(app_client, admin_headers) == ["P4", "P2", "P0"]
+    names = await list_all(app_client, admin_headers, include_archive="true")
+    assert names == [f"P{index}" for index in reversed(range(5))]
+
+
+async def test_only_final_past_appointments_are_archived(app_client, admin_headers, db):
+    past = (await book(app_client, "Past", day="2030-01-07")).json()
+    future = (await book(app_client, "Future", day="2030-03-04")).json()
+    pending = (await book(app_client, "Pending", day="2030-01-07", time="10:30")).json()
+    for appointment in (past, future):
+        await set_status(app_client, admin_headers, appointment["id"], "cancelled")
+
+    assert await archive_appointments(db, date(2030, 2, 1)) == 1
+
+    assert await db.appointments_archive.distinct("name") == ["Past"]
+    assert sorted(await db.appointments.distinct("name")) == ["Future", "Pending"]
+    archived = await db.appointments_archive.find_one({"id": past["id"]})
+    assert archived["archivedAt"]
+    # Slots of archived days can no longer be booked, so their occupancy goes
+    assert await db.slot_occupancy.count_documents({"date": "2030-01-07"}) == 0
+
+
+async def test_archiving_twice_is_harmless(app_client, admin_headers, db):
+    appointment = (await book(app_client, time=None)).json()
+    await set_status(app_client, admin_headers, appointment["id"], "cancelled")
+    assert await archive_appointments(db, date(2031, 1, 1)) == 1
+    assert await archive_appointments(db, date(2031, 1, 1)) == 0
+    assert await db.appointments_archive.count_documents({}) == 1
+
+
+async def test_scheduler_runs_once_per_day(app_client, admin_headers, db):
+    appointment = (await book(app_client, time=None)).json()
+    await set_status(app_client, admin_headers, appointment["id"], "cancelled")
+    scheduler = ArchiveScheduler(db)
+    assert await scheduler.run_once(date(2031, 1, 1)) == 1
+    assert await db.job_runs.count_documents({"_id": "appointment_archive:2031-01-01"}) == 1
+    assert await scheduler.run_once(date(2031, 1, 1)) == 0
@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta, timezone
+
+import jwt
+import pytest
+
+import auth_service
+from conftest import ADMIN_PASSWORD
+
+pytestmark = pytest.mark.anyio
+
+
+def test_token_round_trip():
+    token, expires_in = auth_service.create_access_token("admin")
+    assert expires_in == auth_service.TOKEN_TTL_MINUTES * 60
+    assert auth_service.decode_access_token(token) == "admin"
+
+
+def test_expired_and_forged_tokens_are_rejected():
+    now = datetime.now(timezone.utc)
+    expired = jwt.encode(
+        {"sub": "admin", "iat": now - timedelta(hours=2), "exp": now - timedelta(hours=1)},
+        auth_service.TOKEN_SECRET, algorithm=auth_service.TOKEN_ALGORITHM,
+    )
+    forged = jwt.encode(
+        {"sub": "admin", "iat": now, "exp": now + timedelta(hours=1)},
+        "another-secret-" + "y" * 32, algorithm=auth_service.TOKEN_ALGORITHM,
+    )
+    assert auth_service.decode_access_token(expired) is None
+    assert auth_service.decode_access_token(forged) is None
+    assert auth_service.decode_access_token("not-a-token") is None
+
+
+async def test_password_hashing_runs_off_the_event_loop():
+    password_hash = await auth_service.get_password_hash_async("secret")
+    assert await auth_service.verify_password_async("secret", password_hash)
+    assert not await auth_service.verify_password_async("wrong", password_hash)
+
+
+@pytest.mark.parametrize("headers", [{}, {"Authorization": "Bearer not-a-token"}, {"Authorization": "Basic YWRtaW4="}])
+async def test_admin_routes_need_a_valid_token(app_client, headers):
+    response = await app_client.get("/api/appointments", headers=headers)
+    assert response.status_code == 401
+
+
+async def test_login_issues_a_working_token(app_client, admin_headers):
+    assert (await app_client.get("/api/appointments", headers=admin_headers)).status_code == 200
+
+
+async def test_wrong_password_and_unknown_user_are_rejected_alike(app_client, db):
+    for username, password in (("admin", "wrong"), ("nobody", ADMIN_PASSWORD)):
+        response = await app_client.post("/api/admin/login", json={"username": username, "password": password})
+        assert response.status_code == 401
+    # Failed logins never create accounts
+    assert await db.admin_users.distinct("username") == ["admin"]
+
+
+async def test_change_password(app_client, admin_headers):
+    change = {"username": "admin", "old_password": ADMIN_PASSWORD, "new_password": "new-password"}
+    response = await app_client.post("/api/admin/change-password", json=change, headers=admin_headers)
+    assert response.status_code == 200
+    login = await app_client.post("/api/admin/login", json={"username": "admin", "password": "new-password"})
+    assert login.status_code == 200
+
+    response = await app_client.post(
+        "/api/admin/change-password", json={**change, "username": "other"}, headers=admin_headers
+    )
+    assert response.status_code == 403
@@ -0,0 +1,80 @@
+import asyncio
+from datetime import date
+
+import pytest
+
+from availability import normalize_slot, rebuild_slot_occupancy, reserve_slot, slots_for_day
+from conftest import DAY, SLOT, book, set_status
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.mark.parametrize("typed", ["10:00", "10:00:00", "10:00 AM", "10:00am", "10 AM"])
+def test_slot_times_are_normalized(typed):
+    assert normalize_slot(DAY, typed) == "10:00"
+
+
+@pytest.mark.parametrize("day, time", [
+    (DAY, "10:15"),       # not on the slot grid
+    (DAY, "21:00"),       # closing time
+    ("2030-01-06", "09:00"),  # Sunday opens at 10
+    ("07/01/2030", SLOT),
+    (DAY, "noon"),
+])
+def test_unbookable_slots_are_rejected(day, time):
+    with pytest.raises(ValueError):
+        normalize_slot(day, time)
+
+
+def test_sunday_hours():
+    slots = slots_for_day(date(2030, 1, 6))
+    assert (slots[0], slots[-1]) == ("10:00", "17:30")
+
+
+async def test_full_slot_is_rejected(app_client):
+    assert (await book(app_client, "A")).status_code == 200
+    assert (await book(app_client, "B")).status_code == 200
+    response = await book(app_client, "C")
+    assert response.status_code == 409
+
+
+async def test_cancel_and_delete_release_the_slot(app_client, admin_headers):
+    first = (await book(app_client, "A")).json()
+    second = (await book(app_client, "B")).json()
+
+    assert (await set_status(app_client, admin_headers, first["id"], "cancelled")).status_code == 200
+    assert (await book(app_client, "C")).status_code == 200
+    assert (await book(app_client, "D")).status_code == 409
+
+    response = await app_client.delete(f"/api/appointments/{second['id']}", headers=admin_headers)
+    assert response.status_code == 200
+    assert (await book(app_client, "D")).status_code == 200
+
+
+async def test_reopening_needs_a_free_place(app_client, admin_headers):
+    first = (await book(app_client, "A")).json()
+    await set_status(app_client, admin_headers, first["id"], "cancelled")
+    await book(app_client, "B")
+    await book(app_client, "C")
+
+    response = await set_status(app_client, admin_headers, first["id"], "pending")
+    assert response.status_code == 409
+
+
+async def test_concurrent_reservations_never_exceed_capacity(app_client, db):
+    results = await asyncio.gather(*(reserve_slot(db, DAY, SLOT) for _ in range(6)))
+    assert sorted(results) == [False] * 4 + [True] * 2
+    assert (await db.slot_occupancy.find_one({"_id": f"{DAY}T{SLOT}"}))["count"] == 2
+
+
+async def test_month_availability_and_rebuild(app_client, admin_headers, db):
+    await book(app_client, "A")
+    response = await app_client.get("/api/availability", params={"month": "2030-01"})
+    day = {slot["time"]: slot["available"] for slot in response.json()["days"][DAY]}
+    assert day[SLOT] == 1
+    assert day["10:30"] == 2
+
+    await db.slot_occupancy.delete_many({})
+    await rebuild_slot_occupancy(db)
+    assert (await db.slot_occupancy.find_one({"_id": f"{DAY}T{SLOT}"}))["count"] == 1
+    assert (await app_client.get("/api/availability", params={"month": "2030-13"})).status_code == 400
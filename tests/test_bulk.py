@@ -0,0 +1,76 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+DAY = "2030-01-07"
+
+
+def item(name, time="10:00", **fields):
+    return {"name": name, "phone": "98765 43210", "date": DAY, "time": time, "service": "Cleaning", **fields}
+
+
+async def occupancy(db):
+    slot = await db.slot_occupancy.find_one({"_id": f"{DAY}T10:00"})
+    return slot["count"] if slot else 0
+
+
+async def test_bulk_create_reports_each_item(app_client, admin_headers, db):
+    response = await app_client.post("/api/appointments/bulk", json=[
+        item("A"), {"name": "missing fields"}, item("B", time="2:30 AM"), item("C"), item("D"),
+    ], headers=admin_headers)
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["succeeded"], body["failed"]) == (2, 3)
+    assert [result["success"] for result in body["results"]] == [True, False, False, True, False]
+    assert "fully booked" in body["results"][4]["error"]
+    assert await occupancy(db) == 2
+
+
+async def test_failed_bulk_insert_releases_every_place(app_client, admin_headers, db, monkeypatch):
+    collection_type = type(db.appointments)
+
+    async def unreachable(self, *args, **kwargs):
+        raise TimeoutError("no primary")
+    monkeypatch.setattr(collection_type, "insert_many", unreachable)
+
+    with pytest.raises(TimeoutError):
+        await app_client.post("/api/appointments/bulk", json=[item("A"), item("B")], headers=admin_headers)
+    assert await occupancy(db) == 0
+
+
+async def test_bulk_status_reports_rejected_items(app_client, admin_headers):
+    first = (await app_client.post("/api/appointments", json=item("A"))).json()
+    second = (await app_client.post("/api/appointments", json=item("B"))).json()
+    response = await app_client.patch("/api/appointments/status", json=[
+        {"id": first["id"], "status": "completed"},
+        {"id": second["id"], "status": "confirmed"},
+        {"id": second["id"], "status": "cancelled"},
+        {"id": "missing", "status": "confirmed"},
+    ], headers=admin_headers)
+    assert response.status_code == 200
+    results = sorted(response.json()["results"], key=lambda result: result["index"])
+    assert [result["success"] for result in results] == [False, True, False, False]
+    assert results[2]["error"] == "Duplicate id in batch"
+
+
+async def test_update_changed_again_by_a_later_batch_still_counts(app_client, admin_headers, db, monkeypatch):
+    appointment = (await app_client.post("/api/appointments", json=item("A"))).json()
+    collection_type = type(db.appointments)
+    bulk_write = collection_type.bulk_write
+
+    later_batches = [[{"id": appointment["id"], "status": "cancelled"}]]
+
+    async def then_a_later_batch(self, operations, **kwargs):
+        result = await bulk_write(self, operations, **kwargs)
+        if later_batches:
+            await app_client.patch("/api/appointments/status", json=later_batches.pop(), headers=admin_headers)
+        return result
+    monkeypatch.setattr(collection_type, "bulk_write", then_a_later_batch)
+
+    response = await app_client.patch(
+        "/api/appointments/status", json=[{"id": appointment["id"], "status": "confirmed"}], headers=admin_headers
+    )
+    assert response.json()["results"][0]["success"]
+    monkeypatch.undo()
+    stats = (await app_client.get("/api/stats", headers=admin_headers)).json()
+    assert stats["byStatus"] == {"cancelled": 1}
@@ -0,0 +1,113 @@
+import smtplib
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import book, set_status
+from email_outbox import OUTBOX_DEAD, OUTBOX_PENDING, OUTBOX_SENDING, OUTBOX_SENT, EmailOutboxWorker, enqueue_email
+
+pytestmark = pytest.mark.anyio
+
+APPOINTMENT = {"id": "a1", "name": "Asha", "service": "Cleaning", "date": "2030-01-07", "time": "10:00"}
+
+
+class FakeSession:
+    """Stands in for SMTPSession; raises `errors` in turn, then succeeds"""
+
+    def __init__(self, *errors):
+        self.settings = {"email": "clinic@example.com"}
+        self.errors = list(errors)
+        self.sent = []
+
+    def send(self, message):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.sent.append(message)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+async def outbox_db():
+    from mongomock_motor import AsyncMongoMockClient
+    return AsyncMongoMockClient()["outbox_test"]
+
+
+def make_due(db, message_id):
+    return db.email_outbox.update_one({"id": message_id}, {"$set": {"nextAttemptAt": datetime.utcnow()}})
+
+
+async def test_queued_email_is_sent(outbox_db):
+    message_id = await enqueue_email(outbox_db, "appointment_confirmation", "asha@example.com", APPOINTMENT)
+    session = FakeSession()
+    await EmailOutboxWorker(outbox_db)._drain(session)
+
+    stored = await outbox_db.email_outbox.find_one({"id": message_id})
+    assert stored["status"] == OUTBOX_SENT
+    assert stored["sentAt"]
+    assert [message["To"] for message in session.sent] == ["asha@example.com"]
+    assert "Asha" in session.sent[0].as_string()
+
+
+async def test_failed_sends_back_off_then_dead_letter(outbox_db):
+    message_id = await enqueue_email(outbox_db, "appointment_reminder", "asha@example.com", APPOINTMENT)
+    worker = EmailOutboxWorker(outbox_db, max_attempts=2, backoff_base=30)
+    session = FakeSession(smtplib.SMTPServerDisconnected("gone"), smtplib.SMTPServerDisconnected("gone"))
+
+    await worker._drain(session)
+    stored = await outbox_db.email_outbox.find_one({"id": message_id})
+    assert (stored["status"], stored["attempts"]) == (OUTBOX_PENDING, 1)
+    assert stored["nextAttemptAt"] > datetime.utcnow() + timedelta(seconds=25)
+
+    # Not due yet, so nothing is claimed
+    await worker._drain(session)
+    assert (await outbox_db.email_outbox.find_one({"id": message_id}))["attempts"] == 1
+
+    await make_due(outbox_db, message_id)
+    await worker._drain(session)
+    stored = await outbox_db.email_outbox.find_one({"id": message_id})
+    assert (stored["status"], stored["attempts"]) == (OUTBOX_DEAD, 2)
+    assert stored["deadAt"]
+    assert "gone" in stored["lastError"]
+
+
+async def test_refused_recipient_is_dead_lettered_at_once(outbox_db):
+    message_id = await enqueue_email(outbox_db, "appointment_confirmation", "nobody@example.com", APPOINTMENT)
+    refused = smtplib.SMTPRecipientsRefused({"nobody@example.com": (550, b"no such user")})
+    await EmailOutboxWorker(outbox_db)._drain(FakeSession(refused))
+    assert (await outbox_db.email_outbox.find_one({"id": message_id}))["status"] == OUTBOX_DEAD
+
+
+async def test_expired_lease_is_claimed_again(outbox_db):
+    message_id = await enqueue_email(outbox_db, "appointment_confirmation", "asha@example.com", APPOINTMENT)
+    await outbox_db.email_outbox.update_one({"id": message_id}, {"$set": {
+        "status": OUTBOX_SENDING, "lockedUntil": datetime.utcnow() - timedelta(seconds=1),
+    }})
+    await EmailOutboxWorker(outbox_db)._drain(FakeSession())
+    assert (await outbox_db.email_outbox.find_one({"id": message_id}))["status"] == OUTBOX_SENT
+
+
+async def test_unknown_kind_is_rejected(outbox_db):
+    with pytest.raises(ValueError):
+        await enqueue_email(outbox_db, "newsletter", "asha@example.com", APPOINTMENT)
+
+
+async def test_confirmations_are_only_queued_when_smtp_is_configured(app_client, admin_headers, db, monkeypatch):
+    first = (await book(app_client, "A", email="a@example.com")).json()
+    await set_status(app_client, admin_headers, first["id"], "confirmed")
+    assert await db.email_outbox.count_documents({}) == 0
+
+    monkeypatch.setenv("SMTP_EMAIL", "clinic@example.com")
+    monkeypatch.setenv("SMTP_PASSWORD", "secret")
+    second = (await book(app_client, "B", email="b@example.com")).json()
+    await set_status(app_client, admin_headers, second["id"], "confirmed")
+    assert await db.email_outbox.distinct("recipient") == ["b@example.com"]
+
+
+async def test_finished_emails_expire(outbox_db):
+    import database
+    await database.ensure_outbox_ttl_indexes(outbox_db)
+    indexes = await outbox_db.email_outbox.index_information()
+    assert indexes["sentAt_ttl"]["expireAfterSeconds"] == 30 * 86400
+    assert indexes["deadAt_ttl"]["expireAfterSeconds"] == 30 * 86400
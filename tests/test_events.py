@@ -0,0 +1,100 @@
+import json
+
+import pytest
+
+import events
+from events import AppointmentEventBroker, ChangeStreamRelay
+
+pytestmark = pytest.mark.anyio
+
+
+def parse(frame):
+    fields = dict(line.split(": ", 1) for line in frame.strip().splitlines())
+    return fields["id"], fields["event"], json.loads(fields["data"])
+
+
+def test_published_events_reach_subscribers():
+    broker = AppointmentEventBroker()
+    subscriber, backlog = broker.subscribe()
+    broker.publish("created", {"id": "a1"})
+    assert backlog == []
+    event_id, event_type, data = parse(subscriber.queue.get_nowait())
+    assert (event_id, event_type, data) == (f"{broker.epoch}-1", "created", {"id": "a1"})
+
+
+def test_reconnecting_client_resumes_after_its_last_event():
+    broker = AppointmentEventBroker()
+    for index in range(3):
+        broker.publish("created", {"id": f"a{index}"})
+    _, backlog = broker.subscribe(f"{broker.epoch}-1")
+    assert [parse(frame)[2]["id"] for frame in backlog] == ["a1", "a2"]
+
+
+@pytest.mark.parametrize("last_event_id", ["otherepoch-1", "garbage", "{epoch}-1"])
+def test_unresumable_ids_get_a_reset(last_event_id):
+    broker = AppointmentEventBroker(history_size=2)
+    for index in range(4):
+        broker.publish("created", {"id": f"a{index}"})
+    _, backlog = broker.subscribe(last_event_id.format(epoch=broker.epoch))
+    assert [parse(frame)[1] for frame in backlog] == ["reset"]
+
+
+def test_slow_subscriber_is_dropped():
+    broker = AppointmentEventBroker(max_pending=1)
+    subscriber, _ = broker.subscribe()
+    broker.publish("created", {"id": "a1"})
+    broker.publish("created", {"id": "a2"})
+    assert subscriber.overflowed
+    broker.publish("created", {"id": "a3"})
+    assert subscriber.queue.qsize() == 1
+
+
+async def test_event_stream_sends_retry_then_the_backlog(monkeypatch):
+    broker = AppointmentEventBroker()
+    monkeypatch.setattr(events, "appointment_events", broker)
+    broker.publish("created", {"id": "a1"})
+    broker.publish("deleted", {"id": "a1"})
+
+    stream = events.event_stream(f"{broker.epoch}-1")
+    assert await stream.__anext__() == "retry: 3000\n\n"
+    assert parse(await stream.__anext__())[1] == "deleted"
+    await stream.aclose()
+    assert not broker._subscribers
+
+
+def test_change_stream_events_are_relayed(monkeypatch):
+    broker = AppointmentEventBroker()
+    monkeypatch.setattr(events, "appointment_events", broker)
+    subscriber, _ = broker.subscribe()
+    relay = ChangeStreamRelay(db=None)
+    relay._relay({"operationType": "insert", "fullDocument": {"_id": 1, "id": "a1", "status": "pending"}})
+    relay._relay({
+        "operationType": "update",
+        "fullDocument": {"id": "a1", "status": "confirmed"},
+        "fullDocumentBeforeChange": {"id": "a1", "status": "pending"},
+        "updateDescription": {"updatedFields": {"status": "confirmed"}},
+    })
+    relay._relay({"operationType": "delete", "fullDocumentBeforeChange": {"id": "a1"}})
+
+    frames = [parse(subscriber.queue.get_nowait()) for _ in range(3)]
+    assert [(event_type, data) for _, event_type, data in frames] == [
+        ("created", {"id": "a1", "status": "pending"}),
+        ("status_changed", {"id": "a1", "status": "confirmed", "previousStatus": "pending"}),
+        ("deleted", {"id": "a1"}),
+    ]
+
+
+async def test_routes_publish_changes(app_client, admin_headers, monkeypatch):
+    broker = AppointmentEventBroker()
+    monkeypatch.setattr(events, "appointment_events", broker)
+    subscriber, _ = broker.subscribe()
+    response = await app_client.post("/api/appointments", json={
+        "name": "A", "phone": "98765 43210", "date": "2030-01-07", "service": "Cleaning",
+    })
+    await app_client.delete(f"/api/appointments/{response.json()['id']}", headers=admin_headers)
+    assert [parse(subscriber.queue.get_nowait())[1] for _ in range(2)] == ["created", "deleted"]
+
+
+async def test_feed_needs_an_admin_token(app_client):
+    response = await app_client.get("/api/appointments/events", params={"token": "not-a-token"})
+    assert response.status_code == 401
@@ -0,0 +1,54 @@
+import csv
+import io
+import json
+from datetime import date
+
+import pytest
+
+from archiver import archive_appointments
+from conftest import book, set_status
+from server import EXPORT_FIELDS
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_csv_export(app_client, admin_headers):
+    await book(app_client, "Asha, Jr.", time=None, message='Said "hi"\nthen left')
+    await book(app_client, "Bob", time=None)
+    response = await app_client.get("/api/appointments/export", headers=admin_headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert response.headers["content-disposition"].startswith('attachment; filename="appointments-')
+
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert list(rows[0]) == EXPORT_FIELDS
+    assert [row["name"] for row in rows] == ["Bob", "Asha, Jr."]
+    assert rows[1]["message"] == 'Said "hi"\nthen left'
+
+
+async def test_ndjson_export_with_filters(app_client, admin_headers):
+    await book(app_client, "A", time=None, service="Root Canal")
+    await book(app_client, "B", time=None)
+    response = await app_client.get(
+        "/api/appointments/export", params={"format": "ndjson", "service": "Root Canal"}, headers=admin_headers
+    )
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["name"] for line in lines] == ["A"]
+    assert set(lines[0]) == set(EXPORT_FIELDS)
+
+
+async def test_export_merges_the_archive_newest_first(app_client, admin_headers, db):
+    for index in range(4):
+        appointment = (await book(app_client, f"P{index}", time=None)).json()
+        if index % 2 == 0:
+            await set_status(app_client, admin_headers, appointment["id"], "cancelled")
+    await archive_appointments(db, date(2031, 1, 1))
+
+    response = await app_client.get(
+        "/api/appointments/export", params={"format": "ndjson", "include_archive": "true"}, headers=admin_headers
+    )
+    assert [json.loads(line)["name"] for line in response.text.splitlines()] == ["P3", "P2", "P1", "P0"]
+
+
+async def test_export_needs_an_admin(app_client):
+    assert (await app_client.get("/api/appointments/export")).status_code == 401
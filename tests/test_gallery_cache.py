@@ -0,0 +1,52 @@
+import pytest
+
+from response_cache import ResponseCache, etag_matches
+
+pytestmark = pytest.mark.anyio
+
+IMAGE = {"url": "https://example.com/a.jpg", "title": "Reception", "category": "clinic"}
+
+
+def test_etag_matching():
+    assert etag_matches('"abc"', '"abc"')
+    assert etag_matches('W/"abc", "def"', '"abc"')
+    assert etag_matches("*", '"abc"')
+    assert not etag_matches('"abd"', '"abc"')
+    assert not etag_matches(None, '"abc"')
+
+
+def test_fill_started_before_an_invalidation_is_discarded():
+    cache = ResponseCache(ttl_seconds=60)
+    generation = cache.generation
+    cache.invalidate()
+    cache.set("key", b"stale", generation)
+    assert cache.get("key") is None
+    cache.set("key", b"fresh", cache.generation)
+    assert cache.get("key").body == b"fresh"
+
+
+def test_entries_expire():
+    cache = ResponseCache(ttl_seconds=0)
+    cache.set("key", b"body", cache.generation)
+    assert cache.get("key") is None
+
+
+async def test_revalidation_returns_304(app_client):
+    first = await app_client.get("/api/gallery")
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    again = await app_client.get("/api/gallery", headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.headers["etag"] == etag
+    assert again.content == b""
+
+
+async def test_writes_invalidate_the_cached_gallery(app_client, admin_headers):
+    empty = await app_client.get("/api/gallery")
+    created = await app_client.post("/api/gallery", json=IMAGE, headers=admin_headers)
+    assert created.status_code == 200
+
+    listed = await app_client.get("/api/gallery", headers={"If-None-Match": empty.headers["etag"]})
+    assert listed.status_code == 200
+    assert [image["title"] for image in listed.json()] == ["Reception"]
+    assert (await app_client.get("/api/gallery", params={"category": "team"})).json() == []
@@ -0,0 +1,98 @@
+import pytest
+from fastapi import HTTPException
+
+import gallery_storage
+from gallery_storage import parse_range
+
+pytestmark = pytest.mark.anyio
+
+PNG = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 4
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    monkeypatch.setattr(gallery_storage, "STORAGE_DIR", tmp_path)
+    return tmp_path
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),
+    ("bytes=990-5000", (990, 999)),
+    ("bytes=0-1,5-6", None),
+    ("items=0-1", None),
+    ("bytes=a-b", None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=5-4"])
+def test_unsatisfiable_range(header):
+    with pytest.raises(HTTPException) as error:
+        parse_range(header, 1000)
+    assert error.value.status_code == 416
+    assert error.value.headers["Content-Range"] == "bytes */1000"
+
+
+async def upload(client, headers, content=PNG, title="Smile"):
+    return await client.post(
+        "/api/gallery/upload",
+        data={"title": title, "category": "patients"},
+        files={"file": ("photo.png", content, "application/octet-stream")},
+        headers=headers,
+    )
+
+
+def stored_files(storage):
+    return [path for path in storage.rglob("*") if path.is_file()]
+
+
+async def test_same_content_is_stored_once_and_collected_with_its_last_image(app_client, admin_headers, storage):
+    first = (await upload(app_client, admin_headers, title="One")).json()
+    second = (await upload(app_client, admin_headers, title="Two")).json()
+    assert first["url"] == second["url"]
+    assert first["url"].endswith(".png")
+    assert len(stored_files(storage)) == 1
+
+    listed = await app_client.get("/api/gallery")
+    await app_client.delete(f"/api/gallery/{first['id']}", headers=admin_headers)
+    assert len(stored_files(storage)) == 1
+    # The delete invalidated the cached gallery
+    relisted = await app_client.get("/api/gallery", headers={"If-None-Match": listed.headers["etag"]})
+    assert [image["title"] for image in relisted.json()] == ["Two"]
+
+    await app_client.delete(f"/api/gallery/{second['id']}", headers=admin_headers)
+    assert stored_files(storage) == []
+
+
+async def test_uploads_must_be_images(app_client, admin_headers, storage):
+    response = await upload(app_client, admin_headers, content=b"%PDF-1.7 not an image")
+    assert response.status_code == 415
+    assert stored_files(storage) == []
+
+
+async def test_files_are_served_with_etags_and_ranges(app_client, admin_headers, storage):
+    url = (await upload(app_client, admin_headers)).json()["url"]
+
+    response = await app_client.get(url)
+    assert response.content == PNG
+    assert response.headers["content-type"] == "image/png"
+    assert "immutable" in response.headers["cache-control"]
+    etag = response.headers["etag"]
+    assert (await app_client.get(url, headers={"If-None-Match": etag})).status_code == 304
+
+    partial = await app_client.get(url, headers={"Range": "bytes=8-15"})
+    assert partial.status_code == 206
+    assert partial.content == PNG[8:16]
+    assert partial.headers["content-range"] == f"bytes 8-15/{len(PNG)}"
+    # A stale If-Range gets the whole file
+    whole = await app_client.get(url, headers={"Range": "bytes=8-15", "If-Range": '"stale"'})
+    assert whole.status_code == 200
+
+
+@pytest.mark.parametrize("name", ["missing.png", "..%2Fsecret.png", "a" * 64 + ".png"])
+async def test_unknown_files_are_not_found(app_client, storage, name):
+    assert (await app_client.get(f"/api/gallery/files/{name}")).status_code == 404
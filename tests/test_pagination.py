@@ -0,0 +1,43 @@
+import pytest
+
+from conftest import book, list_all
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_cursor_pages_cover_every_appointment_once(app_client, admin_headers):
+    for index in range(5):
+        await book(app_client, f"P{index}", time=None)
+    assert await list_all(app_client, admin_headers) == [f"P{index}" for index in reversed(range(5))]
+
+
+async def test_appointments_created_between_pages_do_not_shift_the_next_page(app_client, admin_headers):
+    for index in range(4):
+        await book(app_client, f"P{index}", time=None)
+    first = await app_client.get("/api/appointments", params={"limit": 2}, headers=admin_headers)
+    await book(app_client, "New", time=None)
+    second = await app_client.get(
+        "/api/appointments", params={"limit": 2, "cursor": first.headers["x-next-cursor"]}, headers=admin_headers
+    )
+    assert [a["name"] for a in first.json() + second.json()] == ["P3", "P2", "P1", "P0"]
+
+
+async def test_filters(app_client, admin_headers):
+    await book(app_client, "A", time=None, service="Root Canal")
+    await book(app_client, "B", time=None, day="2030-02-01")
+    assert await list_all(app_client, admin_headers, service="Root Canal") == ["A"]
+    assert await list_all(app_client, admin_headers, date_from="2030-01-15") == ["B"]
+    assert await list_all(app_client, admin_headers, status="confirmed") == []
+
+
+async def test_fields_limit_the_response(app_client, admin_headers):
+    await book(app_client, "A", time=None)
+    response = await app_client.get("/api/appointments", params={"fields": "name,status"}, headers=admin_headers)
+    assert response.json() == [{"name": "A", "status": "pending"}]
+    response = await app_client.get("/api/appointments", params={"fields": "name,secret"}, headers=admin_headers)
+    assert response.status_code == 400
+
+
+async def test_invalid_cursor_is_rejected(app_client, admin_headers):
+    response = await app_client.get("/api/appointments", params={"cursor": "not-a-cursor"}, headers=admin_headers)
+    assert response.status_code == 400
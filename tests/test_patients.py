@@ -0,0 +1,80 @@
+import uuid
+
+import pytest
+
+from conftest import book, set_status
+from patients import PATIENT_ID_NAMESPACE, patient_id_for, rebuild_patients
+from search import normalize_phone
+
+pytestmark = pytest.mark.anyio
+
+PATIENT_FIELDS = ("name", "phone", "email", "appointmentCount", "visitCount", "lastAppointmentDate", "lastVisit")
+
+
+@pytest.mark.parametrize("phone", [
+    "9876543210", "98765 43210", "+91 98765-43210", "919876543210", "098765 43210", "0091 98765 43210",
+])
+def test_phone_numbers_reduce_to_the_national_number(phone):
+    assert normalize_phone(phone) == "9876543210"
+    assert patient_id_for(phone) == patient_id_for("9876543210")
+
+
+def test_short_and_missing_numbers():
+    assert normalize_phone("100") == "100"
+    # A 10-digit number starting with 91 is already national
+    assert normalize_phone("9198765432") == "9198765432"
+    assert patient_id_for("") is None
+
+
+async def test_bookings_build_the_patient_record(app_client, admin_headers):
+    first = (await book(app_client, "Asha", time=None, phone="+91 98765 43210", email="asha@example.com")).json()
+    await book(app_client, "Asha K", time=None, phone="098765-43210", day="2030-02-01")
+    for status in ("confirmed", "completed"):
+        await set_status(app_client, admin_headers, first["id"], status)
+
+    response = await app_client.get("/api/patients/lookup", params={"phone": "9876543210"}, headers=admin_headers)
+    assert response.status_code == 200
+    patient = response.json()
+    assert patient["id"] == first["patientId"]
+    assert {field: patient[field] for field in PATIENT_FIELDS} == {
+        "name": "Asha K", "phone": "098765-43210", "email": "asha@example.com",
+        "appointmentCount": 2, "visitCount": 1, "lastAppointmentDate": "2030-02-01", "lastVisit": "2030-01-07",
+    }
+
+    history = await app_client.get(
+        f"/api/patients/{patient['id']}/appointments", params={"limit": 1}, headers=admin_headers
+    )
+    older = await app_client.get(
+        f"/api/patients/{patient['id']}/appointments",
+        params={"limit": 1, "cursor": history.headers["x-next-cursor"]}, headers=admin_headers,
+    )
+    assert [a["name"] for a in history.json() + older.json()] == ["Asha K", "Asha"]
+
+
+async def test_rebuild_matches_the_incremental_record(app_client, admin_headers, db):
+    appointment = (await book(app_client, "Asha", time=None, email="asha@example.com")).json()
+    await book(app_client, "Asha", time=None)
+    await set_status(app_client, admin_headers, appointment["id"], "cancelled")
+    before = await db.patients.find_one({}, {"_id": 0, "updatedAt": 0})
+
+    await rebuild_patients(db)
+    after = await db.patients.find_one({}, {"_id": 0, "updatedAt": 0})
+    assert {field: after.get(field) for field in PATIENT_FIELDS} == {field: before.get(field) for field in PATIENT_FIELDS}
+
+
+async def test_rebuild_rekeys_rows_from_an_older_normalization(app_client, admin_headers, db):
+    appointment = (await book(app_client, "Asha", time=None, phone="+91 98765 43210")).json()
+    legacy_id = str(uuid.uuid5(PATIENT_ID_NAMESPACE, "919876543210"))
+    await db.appointments.update_one({"id": appointment["id"]}, {"$set": {"patientId": legacy_id}})
+    await db.patients.update_one({}, {"$set": {"id": legacy_id}})
+
+    await rebuild_patients(db)
+
+    stored = await db.appointments.find_one({"id": appointment["id"]})
+    assert stored["patientId"] == patient_id_for("9876543210")
+    assert await db.patients.distinct("id") == [patient_id_for("9876543210")]
+
+
+async def test_unknown_patient(app_client, admin_headers):
+    response = await app_client.get("/api/patients/lookup", params={"phone": "12345"}, headers=admin_headers)
+    assert response.status_code == 404
@@ -0,0 +1,46 @@
+from datetime import date
+
+import pytest
+
+from conftest import book, set_status
+from email_service import build_appointment_reminder_message
+from reminders import queue_next_day_reminders
+
+pytestmark = pytest.mark.anyio
+
+TODAY = date(2030, 1, 6)
+TOMORROW = "2030-01-07"
+
+
+def test_reminder_template_escapes_html():
+    message = build_appointment_reminder_message(
+        {"name": "<b>Asha</b>", "service": "Cleaning", "date": TOMORROW, "time": None},
+        "asha@example.com", "clinic@example.com",
+    )
+    text, html = (part.get_payload(decode=True).decode() for part in message.get_payload())
+    assert "<b>Asha</b>" in text
+    assert "&lt;b&gt;Asha&lt;/b&gt;" in html
+    assert "To be confirmed" in text
+    assert message["Subject"].startswith("Appointment Reminder")
+
+
+async def test_reminders_go_to_confirmed_appointments_tomorrow(app_client, admin_headers, db):
+    appointments = {}
+    for name, day, email, status in [
+        ("Due", TOMORROW, "due@example.com", "confirmed"),
+        ("Pending", TOMORROW, "pending@example.com", "pending"),
+        ("NoEmail", TOMORROW, None, "confirmed"),
+        ("Later", "2030-01-08", "later@example.com", "confirmed"),
+    ]:
+        appointment = (await book(app_client, name, time=None, day=day, email=email)).json()
+        if status == "confirmed":
+            await set_status(app_client, admin_headers, appointment["id"], "confirmed")
+        appointments[name] = appointment
+
+    assert await queue_next_day_reminders(db, TODAY) == 1
+    reminders = await db.email_outbox.find({"kind": "appointment_reminder"}).to_list(None)
+    assert [reminder["recipient"] for reminder in reminders] == ["due@example.com"]
+    assert reminders[0]["data"]["id"] == appointments["Due"]["id"]
+
+    # A second run, e.g. after a restart, does not queue it again
+    assert await queue_next_day_reminders(db, TODAY) == 0
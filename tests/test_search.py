@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from search import MAX_SEARCH_CANDIDATES, build_search, normalize_phone_prefix, with_search_fields
+
+pytestmark = pytest.mark.anyio
+
+
+def appointment(index, name, phone="98765 43210", created_at=None):
+    return with_search_fields({
+        "id": f"a{index:04d}", "name": name, "phone": phone, "email": None, "date": "2030-01-07",
+        "time": None, "service": "Cleaning", "message": None, "status": "pending",
+        "createdAt": created_at or datetime(2030, 1, 1) + timedelta(minutes=index),
+    })
+
+
+@pytest.mark.parametrize("typed", ["98765", "+91 98765", "+91-98765", "098765", "0091 98765"])
+def test_phone_queries_match_the_canonical_number(typed):
+    assert normalize_phone_prefix(typed) == "98765"
+    exact, query, _ = build_search(typed)
+    assert query == {"phoneDigits": {"$regex": "^98765"}}
+
+
+def test_name_and_email_queries():
+    exact, _, relevance = build_search("Raj Kumar")
+    assert exact == {"nameWords": ["raj", "kumar"]}
+    assert relevance({"nameWords": ["raj", "kumar"]}) == 3
+    assert relevance({"nameWords": ["raj", "kumari"]}) == 2
+    assert relevance({"nameWords": ["anil", "raj", "kumar"]}) == 1
+    assert build_search("A@Example.com")[0] == {"emailLower": "a@example.com"}
+    with pytest.raises(ValueError):
+        build_search("  -- ")
+
+
+async def search(client, headers, **params):
+    response = await client.get("/api/appointments/search", params=params, headers=headers)
+    assert response.status_code == 200
+    return response
+
+
+async def test_phone_search_finds_formatted_numbers(app_client, admin_headers, db):
+    await db.appointments.insert_one(appointment(1, "Asha", phone="+91 98765-43210"))
+    for typed in ("98765", "+91 98765", "9876543210"):
+        response = await search(app_client, admin_headers, q=typed)
+        assert [a["name"] for a in response.json()] == ["Asha"]
+
+
+async def test_old_exact_match_beats_newer_prefix_matches(app_client, admin_headers, db):
+    await db.appointments.insert_one(appointment(0, "Raj"))
+    await db.appointments.insert_many([
+        appointment(index, f"Rajesh {index}") for index in range(1, MAX_SEARCH_CANDIDATES + 50)
+    ])
+    response = await search(app_client, admin_headers, q="raj", limit=5)
+    assert response.json()[0]["name"] == "Raj"
+
+
+async def test_every_archive_candidate_can_be_paged_to(app_client, admin_headers, db):
+    half = MAX_SEARCH_CANDIDATES // 2 + 20
+    await db.appointments.insert_many([appointment(index, f"Hot {index}") for index in range(half)])
+    await db.appointments_archive.insert_many([
+        appointment(half + index, f"Cold {index}") for index in range(half)
+    ])
+
+    seen, offset = [], 0
+    while offset is not None:
+        response = await search(
+            app_client, admin_headers, q="9876", limit=50, offset=offset, include_archive="true"
+        )
+        seen += [a["id"] for a in response.json()]
+        next_offset = response.headers.get("x-next-offset")
+        offset = int(next_offset) if next_offset else None
+    assert len(seen) == len(set(seen)) == MAX_SEARCH_CANDIDATES
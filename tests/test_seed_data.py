@@ -0,0 +1,75 @@
+import pytest
+
+import database
+from seed_data import Checkpoint, Collection, import_file
+
+pytestmark = pytest.mark.anyio
+
+HEADER = "name,phone,date,time,service\n"
+
+
+@pytest.fixture
+async def import_db():
+    from mongomock_motor import AsyncMongoMockClient
+    db = AsyncMongoMockClient()["import_test"]
+    await database.ensure_indexes(db)
+    return db
+
+
+async def test_reimporting_a_file_skips_the_records_already_present(import_db, tmp_path):
+    path = tmp_path / "bookings.csv"
+    path.write_text(HEADER + "Asha,9876543210,2030-01-07,10:00,Cleaning\n")
+
+    first = await import_file(import_db, Collection.appointments, path, batch_size=10, restart=False)
+    again = await import_file(import_db, Collection.appointments, path, batch_size=10, restart=False)
+
+    assert first == {"read": 1, "written": 1, "skipped": 0, "rejected": 0}
+    assert again == {"read": 1, "written": 0, "skipped": 1, "rejected": 0}
+
+
+async def test_files_with_the_same_name_do_not_share_ids(import_db, tmp_path):
+    for folder, name in (("a", "Asha"), ("b", "Bob")):
+        (tmp_path / folder).mkdir()
+        (tmp_path / folder / "bookings.csv").write_text(HEADER + f"{name},9876543210,2030-01-07,10:00,Cleaning\n")
+        summary = await import_file(
+            import_db, Collection.appointments, tmp_path / folder / "bookings.csv", batch_size=10, restart=False
+        )
+        assert summary["written"] == 1
+
+    assert sorted(await import_db.appointments.distinct("name")) == ["Asha", "Bob"]
+
+
+async def test_interrupted_import_resumes_after_the_checkpoint(import_db, tmp_path):
+    path = tmp_path / "bookings.csv"
+    path.write_text(HEADER + "".join(f"P{index},98765432{index:02d},2030-01-07,,Cleaning\n" for index in range(5)))
+    Checkpoint(path).save(3)
+
+    summary = await import_file(import_db, Collection.appointments, path, batch_size=2, restart=False)
+
+    assert summary["read"] == 2
+    assert sorted(await import_db.appointments.distinct("name")) == ["P3", "P4"]
+    assert not Checkpoint(path).path.exists()
+
+
+async def test_checkpoint_of_a_changed_file_is_ignored(tmp_path):
+    path = tmp_path / "bookings.csv"
+    path.write_text(HEADER)
+    Checkpoint(path).save(3)
+    path.write_text(HEADER + "changed\n")
+    assert Checkpoint(path).load() == 0
+
+
+async def test_imported_times_are_normalized_and_bad_records_rejected(import_db, tmp_path):
+    path = tmp_path / "bookings.csv"
+    path.write_text(HEADER + "".join([
+        "Asha,9876543210,2030-01-07,2:30 PM,Cleaning\n",
+        "Bob,9876543211,07/01/2030,,Cleaning\n",
+        "Chen,9876543212,2030-01-07,03:00,Cleaning\n",
+    ]))
+
+    summary = await import_file(import_db, Collection.appointments, path, batch_size=10, restart=False)
+
+    assert summary["written"] == 1
+    assert summary["rejected"] == 2
+    stored = await import_db.appointments.find_one({"name": "Asha"})
+    assert stored["time"] == "14:30"
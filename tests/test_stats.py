@@ -0,0 +1,62 @@
+import pytest
+
+import stats
+
+pytestmark = pytest.mark.anyio
+
+DAY = "2030-01-07"
+
+
+async def book(client, name="Patient", day=DAY, service="Cleaning"):
+    return await client.post("/api/appointments", json={
+        "name": name, "phone": "98765 43210", "email": "patient@example.com",
+        "date": day, "service": service,
+    })
+
+
+async def test_counters_follow_creates_status_changes_and_deletes(app_client, admin_headers):
+    first = (await book(app_client, "A")).json()
+    await book(app_client, "B", service="Root Canal")
+    await app_client.patch(f"/api/appointments/{first['id']}/status", json={"status": "confirmed"}, headers=admin_headers)
+
+    response = await app_client.get("/api/stats", headers=admin_headers)
+    assert response.json() == {
+        "total": 2,
+        "byStatus": {"pending": 1, "confirmed": 1},
+        "byService": {"Cleaning": 1, "Root Canal": 1},
+        "byDay": {DAY: 2},
+    }
+
+    await app_client.delete(f"/api/appointments/{first['id']}", headers=admin_headers)
+    response = await app_client.get("/api/stats", headers=admin_headers)
+    assert response.json()["total"] == 1
+    assert response.json()["byStatus"] == {"pending": 1}
+
+
+async def test_invalid_date_is_rejected_without_time(app_client):
+    response = await book(app_client, day="someday")
+    assert response.status_code == 400
+
+
+async def test_failed_counter_writes_do_not_fail_the_request(app_client, admin_headers, db, monkeypatch):
+    async def unavailable(*args):
+        raise RuntimeError("stats unavailable")
+    monkeypatch.setattr(stats, "apply_increments", unavailable)
+    monkeypatch.setenv("SMTP_EMAIL", "clinic@example.com")
+    monkeypatch.setenv("SMTP_PASSWORD", "secret")
+
+    created = await book(app_client)
+    assert created.status_code == 200
+    appointment_id = created.json()["id"]
+    response = await app_client.patch(
+        f"/api/appointments/{appointment_id}/status", json={"status": "confirmed"}, headers=admin_headers
+    )
+    assert response.status_code == 200
+    # The confirmation is still queued after the failed counter update
+    assert await db.email_outbox.count_documents({"kind": "appointment_confirmation"}) == 1
+    response = await app_client.delete(f"/api/appointments/{appointment_id}", headers=admin_headers)
+    assert response.status_code == 200
+
+    monkeypatch.undo()
+    await stats.rebuild_stats(db)
+    assert (await app_client.get("/api/stats", headers=admin_headers)).json()["total"] == 0
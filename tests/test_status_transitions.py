@@ -0,0 +1,53 @@
+import pytest
+
+from conftest import book, set_status
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_allowed_transitions(app_client, admin_headers):
+    appointment = (await book(app_client)).json()
+    for status in ("confirmed", "completed"):
+        response = await set_status(app_client, admin_headers, appointment["id"], status)
+        assert response.status_code == 200
+        assert response.json()["status"] == status
+
+
+async def test_rejected_transitions(app_client, admin_headers):
+    appointment = (await book(app_client)).json()
+    response = await set_status(app_client, admin_headers, appointment["id"], "completed")
+    assert response.status_code == 409
+
+    await set_status(app_client, admin_headers, appointment["id"], "cancelled")
+    response = await set_status(app_client, admin_headers, appointment["id"], "confirmed")
+    assert response.status_code == 409
+
+    response = await set_status(app_client, admin_headers, "missing", "confirmed")
+    assert response.status_code == 404
+
+
+async def test_repeated_transition_is_a_no_op(app_client, admin_headers, db):
+    appointment = (await book(app_client)).json()
+    await set_status(app_client, admin_headers, appointment["id"], "confirmed")
+    response = await set_status(app_client, admin_headers, appointment["id"], "confirmed")
+    assert response.status_code == 200
+    assert response.json()["status"] == "confirmed"
+    stats = await db.appointment_stats.find_one({})
+    assert stats["byStatus"]["confirmed"] == 1
+
+
+async def test_cancelled_appointment_can_be_reopened(app_client, admin_headers):
+    appointment = (await book(app_client)).json()
+    await set_status(app_client, admin_headers, appointment["id"], "cancelled")
+    response = await set_status(app_client, admin_headers, appointment["id"], "pending")
+    assert response.status_code == 200
+    assert response.json()["status"] == "pending"
+
+
+async def test_completed_is_final(app_client, admin_headers):
+    appointment = (await book(app_client)).json()
+    for status in ("confirmed", "completed"):
+        await set_status(app_client, admin_headers, appointment["id"], status)
+    for status in ("pending", "confirmed", "cancelled"):
+        response = await set_status(app_client, admin_headers, appointment["id"], status)
+        assert response.status_code == 409
@@ -0,0 +1,86 @@
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Optional
+
+
+class _KeyState:
+    __slots__ = ("failures", "locked_until", "lockouts")
+
+    def __init__(self):
+        self.failures: Deque[float] = deque()
+        self.locked_until = 0.0
+        self.lockouts = 0
+
+
+class SlidingWindowThrottle:
+    """
+    Counts failures per key over a sliding window. Reaching max_failures
+    locks the key out for base_lockout seconds, doubling with each repeated
+    lockout up to max_lockout; a success clears the key.
+    Checking a key is a dictionary lookup, so rejected attempts cost
+    nothing compared to the password hash they would otherwise trigger.
+    At most max_keys keys are tracked; the least recently used are evicted.
+    """
+
+    def __init__(
+        self,
+        max_failures: int,
+        window_seconds: float,
+        base_lockout: float,
+        max_lockout: float,
+        max_keys: int = 10000,
+    ):
+        self.max_failures = max_failures
+        self.window_seconds = window_seconds
+        self.base_lockout = base_lockout
+        self.max_lockout = max_lockout
+        self.max_keys = max_keys
+        self._states: "OrderedDict[str, _KeyState]" = OrderedDict()
+
+    def retry_after(self, key: str, now: Optional[float] = None) -> float:
+        """Seconds until the key may try again; 0 if it is not locked out"""
+        state = self._states.get(key)
+        if state is None:
+            return 0.0
+        now = time.monotonic() if now is None else now
+        return max(state.locked_until - now, 0.0)
+
+    def record_failure(self, key: str, now: Optional[float] = None) -> None:
+        now = time.monotonic() if now is None else now
+        state = self._states.get(key)
+        if state is None:
+            state = self._states[key] = _KeyState()
+            if len(self._states) > self.max_keys:
+                self._states.popitem(last=False)
+        else:
+            self._states.move_to_end(key)
+
+        state.failures.append(now)
+        while state.failures and state.failures[0] <= now - self.window_seconds:
+            state.failures.popleft()
+        if len(state.failures) >= self.max_failures:
+            state.lockouts += 1
+            lockout = min(self.base_lockout * 2 ** (state.lockouts - 1), self.max_lockout)
+            state.locked_until = now + lockout
+            state.failures.clear()
+
+    def record_success(self, key: str) -> None:
+        self._states.pop(key, None)
+
+
+# Admin login throttles: a username is locked out quickly on the IP the
+# failures come from, an IP (which may be shared by a whole office) after
+# more failures
+username_throttle = SlidingWindowThrottle(
+    max_failures=int(os.environ.get('LOGIN_MAX_FAILURES_PER_USERNAME', '5')),
+    window_seconds=300,
+    base_lockout=30,
+    max_lockout=3600,
+)
+ip_throttle = SlidingWindowThrottle(
+    max_failures=int(os.environ.get('LOGIN_MAX_FAILURES_PER_IP', '20')),
+    window_seconds=300,
+    base_lockout=60,
+    max_lockout=3600,
+)